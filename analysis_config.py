@@ -0,0 +1,19 @@
+DEFAULT_CONFIG_PATH = 'csv_lines_config.yaml'
+
+
+def load_config(config_path=DEFAULT_CONFIG_PATH, section=None):
+    """
+    Load one section of an analysis config file.
+
+    Parameters:
+        config_path (str): Path of the YAML config file.
+        section (str or None): Name of the section to use, None for the one named by the file's `config` key.
+
+    Returns:
+        config (dict): The config section.
+    """
+    import yaml
+
+    with open(config_path, 'r') as file:
+        data = yaml.safe_load(file)
+    return data[section or data['config']]
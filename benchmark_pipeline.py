@@ -0,0 +1,128 @@
+"""
+Benchmark every stage of the offline pipeline on synthetic flights of increasing size and report scaling curves.
+
+For each size a pair of synthetic flights (see synthetic_flight.py) is written once into --data-dir and reused by
+later runs. Every stage is timed as the best of --repeat runs. The report gives the time per size, the throughput at
+the largest size and the log-log slope of time against rows (1 = linear scaling).
+
+    python benchmark_pipeline.py --sizes 10000 100000 1000000 --repeat 3 --json benchmark.json
+"""
+import contextlib
+import io
+import json
+import os
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from find_shabash_2d_bins import find_shabash_2d_bins
+from multi_dim_histogram import multi_dim_histogram
+from ransac_3d import custom_ransac
+from read_csv import load_data_from_csv
+from separate_layers import group_heights_by_count
+from source_localization import localize_from_histograms
+from subtract_histograms import subtraction_histograms_avg_loc, average_loc_of_points_per_bin
+from synthetic_flight import PATTERNS, flight_config, generate_flight_pair
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+def time_best(function, repeat):
+    """Return the best wall time of `repeat` calls and the result of the last one. Prints are silenced."""
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def benchmark_size(config, repeat):
+    """Time each stage on the flight pair of a config. Returns a dict of stage name to seconds."""
+    timings = {}
+    bins = config['histogram_bins_difference_graph']
+    path1 = config['graphs'][0]['files'][0]['csv_file_path']
+    path2 = config['graphs'][1]['files'][0]['csv_file_path']
+
+    timings['load_data_from_csv'], (sample1, values1) = time_best(lambda: load_data_from_csv(config, path1), repeat)
+    sample2, values2 = load_data_from_csv(config, path2)
+    timings['multi_dim_histogram'], _ = time_best(lambda: multi_dim_histogram(sample1, values1, bins), repeat)
+    timings['subtraction_histograms_avg_loc'], (avg_value_hist1, avg_value_hist2, _, common_edges) = time_best(
+        lambda: subtraction_histograms_avg_loc(sample1, values1, sample2, values2, bins), repeat)
+    timings['average_loc_of_points_per_bin'], (average_locations1, average_locations2) = time_best(
+        lambda: average_loc_of_points_per_bin(sample1, sample2, common_edges), repeat)
+    # The per-point stages run on the raw points, so that their cost scales with the flight size
+    timings['group_heights_by_count'], _ = time_best(lambda: group_heights_by_count(sample1[2]), repeat)
+    timings['find_shabash_2d_bins'], _ = time_best(lambda: find_shabash_2d_bins(sample1[0], sample1[1], values1),
+                                                   repeat)
+
+    result = localize_from_histograms(average_locations1, average_locations2, avg_value_hist1, avg_value_hist2,
+                                      ground_asl=config['ground_asl'])
+    layer_estimates = [estimate for estimate in result['layer_estimates'] if estimate is not None]
+    if len(layer_estimates) >= 2:
+        timings['custom_ransac'], _ = time_best(
+            lambda: custom_ransac(layer_estimates, config['ground_asl'], plot=False), repeat)
+    return timings
+
+
+def scaling_report(sizes, timings_per_size):
+    """Return, per stage, its times, throughput at the largest size and log-log slope of time against rows."""
+    report = {}
+    for stage in timings_per_size[-1]:
+        times = [timings.get(stage) for timings in timings_per_size]
+        measured = [(size, seconds) for size, seconds in zip(sizes, times) if seconds]
+        slope = None
+        if len(measured) >= 2:
+            slope = float(np.polyfit(np.log([size for size, _ in measured]),
+                                     np.log([seconds for _, seconds in measured]), 1)[0])
+        report[stage] = {'seconds': times, 'rows_per_second': sizes[-1] / times[-1] if times[-1] else None,
+                         'scaling_exponent': slope}
+    return report
+
+
+def print_report(sizes, report):
+    header = f"{'stage':<32}" + ''.join(f'{size:>12,}' for size in sizes) + f"{'rows/s':>14}{'slope':>8}"
+    print(header)
+    for stage, row in report.items():
+        times = ''.join(f'{seconds:11.4f}s' if seconds is not None else f"{'-':>12}" for seconds in row['seconds'])
+        rate = f"{row['rows_per_second']:14,.0f}" if row['rows_per_second'] else f"{'-':>14}"
+        slope = f"{row['scaling_exponent']:8.2f}" if row['scaling_exponent'] is not None else f"{'-':>8}"
+        print(f'{stage:<32}{times}{rate}{slope}')
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='rows per flight')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the best is kept')
+    parser.add_argument('--pattern', choices=PATTERNS, default='lawnmower')
+    parser.add_argument('--data-dir', default='synthetic_flights', help='where the synthetic flights are kept')
+    parser.add_argument('--data', choices=['downlink', 'uplink', 'rssi'], default='downlink',
+                        help='info column the pipeline runs on')
+    parser.add_argument('--json', help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    sizes = sorted(args.sizes)
+    timings_per_size = []
+    for size in sizes:
+        paths = [os.path.join(args.data_dir, f'{name}_{args.pattern}_{size}.csv')
+                 for name in ('with_source', 'without_source')]
+        if not all(os.path.exists(path) for path in paths):
+            print(f'generating {size:,} row flights...')
+            paths = generate_flight_pair(args.data_dir, size, pattern=args.pattern)
+        config = flight_config(*paths, data=args.data)
+        print(f'benchmarking {size:,} rows...')
+        timings_per_size.append(benchmark_size(config, args.repeat))
+
+    report = scaling_report(sizes, timings_per_size)
+    print_report(sizes, report)
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump({'sizes': sizes, 'pattern': args.pattern, 'data': args.data, 'stages': report}, report_file,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    main()
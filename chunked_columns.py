@@ -0,0 +1,66 @@
+import itertools
+
+import numpy as np
+
+CHUNK_ROWS = 65536
+
+
+def iter_column_chunks(rows, fieldnames, chunk_rows=CHUNK_ROWS):
+    """
+    Group an iterator of csv rows into column-major blocks of up to chunk_rows rows.
+
+    Yields:
+        columns (dict of str -> tuple of str): Column name to the raw cells of the block, '' for missing cells.
+    """
+    rows = iter(rows)
+    while True:
+        block = list(itertools.islice(rows, chunk_rows))
+        if not block:
+            return
+        cells = itertools.zip_longest(*block, fillvalue='')
+        yield dict(zip(fieldnames, cells))
+
+
+def column_cells(chunk, name):
+    """Return the cells of a column of a block, all empty if the CSV has no such column."""
+    if name in chunk:
+        return chunk[name]
+    return ('',) * len(next(iter(chunk.values())))
+
+
+def float_cells(cells):
+    """Convert a block of raw CSV cells to float64 in one vectorized cast, empty cells become NaN."""
+    cells = np.array(cells, dtype=str)
+    return np.where(cells == '', 'nan', cells).astype(np.float64)
+
+
+def int_cells(cells, missing):
+    """Convert a block of raw CSV cells to int64 in one vectorized cast, empty cells become `missing`."""
+    cells = np.array(cells, dtype=str)
+    return np.where(cells == '', str(missing), cells).astype(np.int64)
+
+
+class GrowableArray:
+    """A NumPy buffer that is appended to in blocks, doubling its capacity when full."""
+
+    def __init__(self, dtype=np.float64, row_shape=(), capacity=CHUNK_ROWS):
+        self._buffer = np.empty((capacity,) + tuple(row_shape), dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._buffer.dtype)
+        end = self._size + len(values)
+        if end > len(self._buffer):
+            grown = np.empty((max(end, 2 * len(self._buffer)),) + self._buffer.shape[1:], dtype=self._buffer.dtype)
+            grown[:self._size] = self._buffer[:self._size]
+            self._buffer = grown
+        self._buffer[self._size:end] = values
+        self._size = end
+
+    @property
+    def array(self):
+        """The filled part of the buffer (a view, valid until the next extend)."""
+        return self._buffer[:self._size]
@@ -0,0 +1,150 @@
+import csv
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from chunked_columns import GrowableArray, column_cells, float_cells, int_cells, iter_column_chunks
+from rssi_matrix import build_rssi_matrix, stack_rssi_matrices
+
+CACHE_VERSION = 2
+CACHE_SUFFIX = '.cache'
+META_FILE_NAME = 'meta.json'
+
+# Columns kept as float64, missing values are stored as NaN
+FLOAT_COLUMNS = ['lat', 'lon', 'aboveSeaLevel', 'upLinkPercent', 'downLinkPercent']
+MISSING_NANO_TIME = -1
+
+
+def cache_dir_for(csv_file_path):
+    """Return the sidecar directory holding the columnar cache of a CSV file."""
+    return csv_file_path + CACHE_SUFFIX
+
+
+def file_signature(csv_file_path):
+    stat = os.stat(csv_file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def content_hash(csv_file_path, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(csv_file_path, mode='rb') as csvfile:
+        for block in iter(lambda: csvfile.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def load_columns(csv_file_path):
+    """
+    Load the telemetry columns of a CSV file as read-only memory-mapped arrays.
+
+    The columns are parsed once into a `.npy` sidecar cache next to the CSV. The cache is keyed on the file size,
+    mtime and content hash and is rebuilt automatically when the CSV changes.
+
+    Parameters:
+        csv_file_path (str): Path of the telemetry CSV file.
+
+    Returns:
+        columns (dict of str -> np.ndarray): Column name to (memory-mapped) array, one entry per CSV row. The
+            'rssi' column is a (rows x frequency bins) matrix, see load_rssi_frequencies for its bins.
+    """
+    cache_dir = cache_dir_for(csv_file_path)
+    meta = _read_meta(cache_dir)
+    if not _is_fresh(meta, csv_file_path):
+        meta = build_cache(csv_file_path)
+    return {name: np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r') for name in meta['columns']}
+
+
+def build_cache(csv_file_path):
+    """Parse a CSV file and (re)write its columnar sidecar cache. Returns the cache metadata."""
+    cache_dir = cache_dir_for(csv_file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, META_FILE_NAME)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # Invalidate first, the metadata is written last once all columns are in place
+
+    signature = file_signature(csv_file_path)
+    columns, rssi_frequencies = parse_columns(csv_file_path)
+    for name, values in columns.items():
+        tmp_path = os.path.join(cache_dir, f'{name}.npy.{os.getpid()}.tmp')  # Per process, see _write_meta
+        with open(tmp_path, mode='wb') as column_file:
+            np.save(column_file, values)
+        os.replace(tmp_path, os.path.join(cache_dir, f'{name}.npy'))
+
+    meta = {
+        'version': CACHE_VERSION,
+        'size': signature['size'],
+        'mtime_ns': signature['mtime_ns'],
+        'sha1': content_hash(csv_file_path),
+        'rows': len(columns['videoNanoTime']),
+        'columns': list(columns),
+        'rssi_frequencies': rssi_frequencies.tolist(),
+    }
+    _write_meta(cache_dir, meta)
+    return meta
+
+
+def load_rssi_frequencies(csv_file_path):
+    """Return the frequencyFrom of each column of the cached 'rssi' matrix. Call after load_columns."""
+    return np.array(_read_meta(cache_dir_for(csv_file_path))['rssi_frequencies'], dtype=np.float64)
+
+
+def parse_columns(csv_file_path):
+    """
+    Parse every row of a telemetry CSV file into NumPy column arrays.
+
+    Returns:
+        columns (dict of str -> np.ndarray): One entry per CSV row, 'rssi' being a (rows x bins) matrix.
+        rssi_frequencies (np.ndarray): frequencyFrom of each column of the 'rssi' matrix.
+    """
+    nano_times = GrowableArray(np.int64)
+    floats = {name: GrowableArray(np.float64) for name in FLOAT_COLUMNS}
+    rssi_blocks = []
+    with open(csv_file_path, mode='r', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        fieldnames = next(reader, [])
+        for chunk in iter_column_chunks((row for row in reader if row), fieldnames):  # csv skips empty lines
+            nano_times.extend(int_cells(column_cells(chunk, 'videoNanoTime'), MISSING_NANO_TIME))
+            for name in FLOAT_COLUMNS:
+                floats[name].extend(float_cells(column_cells(chunk, name)))
+            rssi_blocks.append(build_rssi_matrix(column_cells(chunk, 'signalInterference')))
+
+    columns = {'videoNanoTime': nano_times.array}
+    columns.update({name: values.array for name, values in floats.items()})
+    columns['rssi'], rssi_frequencies = stack_rssi_matrices(rssi_blocks)
+    if len(columns['rssi']) != len(nano_times):  # Empty file
+        columns['rssi'] = np.empty((len(nano_times), 0), dtype=np.float32)
+    return columns, rssi_frequencies
+
+
+def _is_fresh(meta, csv_file_path):
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+    signature = file_signature(csv_file_path)
+    if signature['size'] != meta['size']:
+        return False
+    if signature['mtime_ns'] == meta['mtime_ns']:
+        return True
+    # Same size but touched: only rebuild if the content really changed
+    if content_hash(csv_file_path) != meta['sha1']:
+        return False
+    meta['mtime_ns'] = signature['mtime_ns']
+    _write_meta(cache_dir_for(csv_file_path), meta)
+    return True
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILE_NAME), mode='r') as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(cache_dir, meta):
+    # A temporary file per process, so processes building the same cache never replace each other's file
+    tmp_path = os.path.join(cache_dir, f'{META_FILE_NAME}.{os.getpid()}.tmp')
+    with open(tmp_path, mode='w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(tmp_path, os.path.join(cache_dir, META_FILE_NAME))
@@ -0,0 +1,89 @@
+import contextlib
+import csv
+import itertools
+import os
+
+import numpy as np
+
+from chunked_columns import CHUNK_ROWS, iter_column_chunks
+from csv_cache import cache_dir_for, file_signature
+
+ROW_INDEX_STRIDE = 1024
+ROW_INDEX_FILE_NAME = 'row_index.npz'
+
+
+def load_row_index(csv_file_path, stride=ROW_INDEX_STRIDE):
+    """
+    Load the sparse byte-offset index of a CSV file, building it if missing or stale.
+
+    The index holds the byte offset of every `stride`-th data row and is persisted in the CSV's sidecar directory.
+    It assumes one row per line, which holds for the telemetry CSVs (no quoted newlines).
+
+    Returns:
+        offsets (np.ndarray): offsets[k] is the byte offset of data row k * stride.
+        rows (int): Number of data rows in the file.
+    """
+    index_path = os.path.join(cache_dir_for(csv_file_path), ROW_INDEX_FILE_NAME)
+    signature = file_signature(csv_file_path)
+    try:
+        with np.load(index_path) as index:
+            if (int(index['size']) == signature['size'] and int(index['mtime_ns']) == signature['mtime_ns']
+                    and int(index['stride']) == stride):
+                return index['offsets'], int(index['rows'])
+    except (OSError, KeyError, ValueError):
+        pass
+    return build_row_index(csv_file_path, stride)
+
+
+def build_row_index(csv_file_path, stride=ROW_INDEX_STRIDE):
+    signature = file_signature(csv_file_path)
+    offsets = []
+    rows = 0
+    with open(csv_file_path, mode='rb') as csvfile:
+        offset = len(csvfile.readline())  # Skip the header
+        for line in csvfile:
+            if line.rstrip(b'\r\n'):  # csv skips empty lines
+                if rows % stride == 0:
+                    offsets.append(offset)
+                rows += 1
+            offset += len(line)
+    offsets = np.array(offsets, dtype=np.int64)
+
+    cache_dir = cache_dir_for(csv_file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = os.path.join(cache_dir, f'{ROW_INDEX_FILE_NAME}.{os.getpid()}.tmp')  # Per process, see csv_cache
+    with open(tmp_path, mode='wb') as index_file:
+        np.savez(index_file, offsets=offsets, rows=rows, stride=stride, **signature)
+    os.replace(tmp_path, os.path.join(cache_dir, ROW_INDEX_FILE_NAME))
+    return offsets, rows
+
+
+def iter_row_chunks(csv_file_path, start_row=None, end_row=None, chunk_rows=CHUNK_ROWS, stride=ROW_INDEX_STRIDE):
+    """
+    Stream the rows [start_row:end_row] of a CSV file in blocks of up to chunk_rows rows.
+
+    Yields:
+        columns (dict of str -> tuple of str): Column name to the raw cells of the block, '' for missing cells.
+    """
+    with _open_row_range(csv_file_path, start_row, end_row, stride) as (csvfile, fieldnames, skip, stop):
+        reader = itertools.islice((row for row in csv.reader(csvfile) if row), skip, stop)  # csv skips empty lines
+        yield from iter_column_chunks(reader, fieldnames, chunk_rows)
+
+
+@contextlib.contextmanager
+def _open_row_range(csv_file_path, start_row, end_row, stride):
+    """Open a CSV file positioned at or before start_row. Yields (file, fieldnames, first row, stop row) to islice."""
+    with open(csv_file_path, mode='r', newline='') as csvfile:
+        fieldnames = next(csv.reader(csvfile), [])
+        if not start_row and end_row is None:
+            yield csvfile, fieldnames, 0, None  # Whole file, no need for the index
+            return
+
+        offsets, rows = load_row_index(csv_file_path, stride)
+        start_row, end_row, _ = slice(start_row, end_row).indices(rows)
+        count = max(end_row - start_row, 0)
+        block = start_row // stride
+        if count:
+            csvfile.seek(int(offsets[block]))  # Byte offsets are valid seek positions for stateless encodings
+        skip = start_row - block * stride if count else 0
+        yield csvfile, fieldnames, skip, skip + count
@@ -1,24 +1,15 @@
+from typing import TYPE_CHECKING
+
 import numpy as np
-from matplotlib import pyplot as plt  # Compute bin centers from edges
 
+from sparse_histogram import SparseGrid
 
-def display_histogram(histogram_results: np.ndarray, edges: np.ndarray, ax: plt.Axes, axis_labels: np.ndarray | list[str], cmap, norm, show_shabash, shabash_loc):
-    x_centers = 0.5 * (edges[0][1:] + edges[0][:-1])
-    y_centers = 0.5 * (edges[1][1:] + edges[1][:-1])
-    z_centers = 0.5 * (edges[2][1:] + edges[2][:-1])
+if TYPE_CHECKING:  # Only for the annotations, the axes come from the caller
+    from matplotlib import pyplot as plt
 
-    # Create a 3D meshgrid of the bin centers
-    X, Y, Z = np.meshgrid(x_centers, y_centers, z_centers, indexing="ij")
 
-    # Flatten the histogram and the meshgrid arrays
-    values = histogram_results.flatten()
-    X_flat = X.flatten()
-    Y_flat = Y.flatten()
-    Z_flat = Z.flatten()
-
-    # Filter out NaN values
-    valid = ~np.isnan(values)
-    X_valid, Y_valid, Z_valid, values_valid = X_flat[valid], Y_flat[valid], Z_flat[valid], values[valid]
+def display_histogram(histogram_results: np.ndarray, edges: np.ndarray, ax: 'plt.Axes', axis_labels: np.ndarray | list[str], cmap, norm, show_shabash, shabash_loc):
+    X_valid, Y_valid, Z_valid, values_valid = histogram_points(histogram_results, edges)
 
     # Scatter plot
     # Scale point sizes dynamically
@@ -33,3 +24,33 @@ def display_histogram(histogram_results: np.ndarray, edges: np.ndarray, ax: plt.
     if show_shabash:
         ax.plot(shabash_loc[0], shabash_loc[1], shabash_loc[2], 'ro')
 
+
+def histogram_points(histogram_results, edges):
+    """Return the x, y and z centres and the values of the bins of a dense or sparse histogram that hold a value."""
+    if isinstance(histogram_results, SparseGrid):
+        # Only the occupied bins are stored, their centres are computed directly
+        centers = histogram_results.centers()
+        values = histogram_results.values
+        valid = ~np.isnan(values)
+        return centers[valid, 0], centers[valid, 1], centers[valid, 2], values[valid]
+    return _dense_bin_centers(histogram_results, edges)
+
+
+def _dense_bin_centers(histogram_results, edges):
+    x_centers = 0.5 * (edges[0][1:] + edges[0][:-1])
+    y_centers = 0.5 * (edges[1][1:] + edges[1][:-1])
+    z_centers = 0.5 * (edges[2][1:] + edges[2][:-1])
+
+    # Create a 3D meshgrid of the bin centers
+    X, Y, Z = np.meshgrid(x_centers, y_centers, z_centers, indexing="ij")
+
+    # Flatten the histogram and the meshgrid arrays
+    values = histogram_results.flatten()
+    X_flat = X.flatten()
+    Y_flat = Y.flatten()
+    Z_flat = Z.flatten()
+
+    # Filter out NaN values
+    valid = ~np.isnan(values)
+    X_valid, Y_valid, Z_valid, values_valid = X_flat[valid], Y_flat[valid], Z_flat[valid], values[valid]
+    return X_valid, Y_valid, Z_valid, values_valid
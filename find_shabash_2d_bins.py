@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 def find_shabash_2d_bins(x_history, y_history, evodif_history, plot=False):
     """
@@ -19,7 +18,6 @@ def find_shabash_2d_bins(x_history, y_history, evodif_history, plot=False):
     x_history = np.asarray(x_history)
     y_history = np.asarray(y_history)
     evodif_history = np.asarray(evodif_history)
-    print(f'evodif_history={np.unique(evodif_history, return_counts=True)}')
 
     # Determine the cutoff for the top 10% of evodif values
     threshold = np.percentile(evodif_history, 97)
@@ -44,6 +42,9 @@ def find_shabash_2d_bins(x_history, y_history, evodif_history, plot=False):
 
 
     if plot:
+        import matplotlib.pyplot as plt
+
+        print(f'evodif_history={np.unique(evodif_history, return_counts=True)}')
         # Plot all points
         plt.figure(figsize=(10, 8))
         plt.scatter(x_history, y_history, label="All points", alpha=0.6, color="blue")
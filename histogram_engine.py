@@ -0,0 +1,273 @@
+from typing import Sequence
+import numpy as np
+
+
+def histogram_edges(sample, bins: int | Sequence[int]):
+    """
+    Compute the bin edges np.histogramdd would use for `sample` with range=None.
+
+    Parameters:
+        sample (array-like): Coordinates of shape (D, N).
+        bins (int or Sequence[int]): Number of bins in each dimension.
+
+    Returns:
+        edges (list of ndarray): D arrays of bin edges.
+    """
+    sample = np.asarray(sample, dtype=np.float64)
+    n_dims = sample.shape[0]
+    bins = [bins] * n_dims if np.ndim(bins) == 0 else list(bins)
+    edges = []
+    for dim, n_bins in zip(sample, bins):
+        dim_min, dim_max = (dim.min(), dim.max()) if dim.size else (0.0, 1.0)
+        if dim_min == dim_max:
+            dim_min, dim_max = dim_min - 0.5, dim_max + 0.5
+        edges.append(np.linspace(dim_min, dim_max, int(n_bins) + 1))
+    return edges
+
+
+def flat_bin_index(sample, edges):
+    """
+    Compute the flat (C-order) bin index of every point, with the same binning rules as np.histogramdd.
+
+    Bins are half-open except the last one in each dimension, which includes its right edge.
+
+    Parameters:
+        sample (array-like): Coordinates of shape (D, N).
+        edges (list of ndarray): D arrays of monotonically increasing bin edges.
+
+    Returns:
+        flat_index (ndarray): int64 array of shape (N,), -1 for points outside the grid.
+    """
+    sample = np.asarray(sample, dtype=np.float64)
+    shape = tuple(len(dim_edges) - 1 for dim_edges in edges)
+    multi_index = []
+    inside = np.ones(sample.shape[1], dtype=bool)
+    for dim, dim_edges in zip(sample, edges):
+        index = np.searchsorted(dim_edges, dim, side='right') - 1
+        index[dim == dim_edges[-1]] -= 1  # The rightmost edge belongs to the last bin
+        inside &= (0 <= index) & (index < len(dim_edges) - 1)
+        multi_index.append(index)
+    flat_index = np.full(sample.shape[1], -1, dtype=np.int64)
+    flat_index[inside] = np.ravel_multi_index([index[inside] for index in multi_index], shape)
+    return flat_index
+
+
+def binned_statistics(sample, values, edges, sum_squares=False):
+    """
+    Bin every point once and accumulate the per-bin sum and count of its values.
+
+    Parameters:
+        sample (array-like): Coordinates of shape (D, N).
+        values (array-like): Values of shape (N,).
+        edges (list of ndarray): D arrays of bin edges.
+        sum_squares (bool): Also accumulate the per-bin sum of squared values.
+
+    Returns:
+        hist_sum (ndarray): Sum of the values in each bin.
+        hist_count (ndarray): Number of points in each bin.
+        hist_sum_squares (ndarray): Only if sum_squares, sum of the squared values in each bin.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    shape = tuple(len(dim_edges) - 1 for dim_edges in edges)
+    flat_index = flat_bin_index(sample, edges)
+    inside = flat_index >= 0
+    flat_index, values = flat_index[inside], values[inside]
+
+    n_bins = int(np.prod(shape))
+    hist_sum = np.bincount(flat_index, weights=values, minlength=n_bins).reshape(shape)
+    hist_count = np.bincount(flat_index, minlength=n_bins).astype(np.float64).reshape(shape)
+    if not sum_squares:
+        return hist_sum, hist_count
+    hist_sum_squares = np.bincount(flat_index, weights=values * values, minlength=n_bins).reshape(shape)
+    return hist_sum, hist_count, hist_sum_squares
+
+
+def binned_mean_location(sample, edges):
+    """
+    Average the coordinates of the points falling in each bin, as a grouped reduction over flat bin indices.
+
+    Parameters:
+        sample (array-like): Coordinates of shape (D, N).
+        edges (list of ndarray): D arrays of bin edges.
+
+    Returns:
+        mean_location (ndarray): Array of shape (*bins, D), NaN in bins that have no points.
+    """
+    sample = np.asarray(sample, dtype=np.float64)
+    shape = tuple(len(dim_edges) - 1 for dim_edges in edges)
+    flat_index = flat_bin_index(sample, edges)
+    inside = flat_index >= 0
+    flat_index, sample = flat_index[inside], sample[:, inside]
+
+    n_bins = int(np.prod(shape))
+    count = np.bincount(flat_index, minlength=n_bins).astype(np.float64)
+    location_sum = np.stack([np.bincount(flat_index, weights=dim, minlength=n_bins) for dim in sample], axis=-1)
+    return average_grid(location_sum, count[:, np.newaxis]).reshape(shape + (len(sample),))
+
+
+def average_grid(hist_sum, hist_count):
+    """Divide a sum grid by its count grid, with NaN in bins that have no points."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_hist = np.divide(hist_sum, hist_count)
+    avg_hist[np.broadcast_to(hist_count == 0, avg_hist.shape)] = np.nan  # Handle empty bins
+    return avg_hist
+
+
+def difference_grid(avg_hist1, avg_hist2):
+    """Subtract two average grids, with NaN wherever either of them is NaN."""
+    with np.errstate(invalid='ignore'):
+        diff_hist = avg_hist1 - avg_hist2
+        diff_hist[np.isnan(avg_hist1) | np.isnan(avg_hist2)] = np.nan
+    return diff_hist
+
+
+class HistogramAccumulator:
+    """
+    Running per-bin sum and count of values over a 3D grid.
+
+    Points are added one at a time in O(1) with add_point, or in batches with add. Accumulators over the same edges
+    built by independent workers (e.g. over separate CSV chunks) are combined with merge, which gives the same
+    grids as accumulating all the points at once. With track_locations=True the per-bin sum of the point
+    coordinates is kept too, for the average location of the points of each bin.
+
+    With growable=True the grid must be regular: it is extended by whole bins of the same size whenever a point
+    falls outside it, growing by at least its current size so that extensions are amortized O(1). max_bins caps the
+    number of bins of each dimension, a point the grid can't grow to without passing the cap (e.g. a GPS row
+    without a fix at lat/lon 0) is skipped like a point outside a fixed grid. Skipped points are counted in
+    `outside`.
+    """
+
+    def __init__(self, edges, growable=False, track_locations=False, max_bins=None):
+        """
+        Parameters:
+            edges (Sequence[np.ndarray]): Bin edges of each dimension.
+            growable (bool): Extend the grid to the points outside it instead of skipping them.
+            track_locations (bool): Also keep the per-bin sum of the point coordinates.
+            max_bins (Sequence[int] or None): Most bins a growable grid may have in each dimension, None for no cap.
+        """
+        self.edges = [np.asarray(dim_edges, dtype=np.float64) for dim_edges in edges]
+        self.growable = growable
+        shape = tuple(len(dim_edges) - 1 for dim_edges in self.edges)
+        self.max_bins = None if max_bins is None else [max(int(dim_max), n_bins)
+                                                       for dim_max, n_bins in zip(max_bins, shape)]
+        self.outside = 0  # Points skipped because they fall outside the grid
+        self.hist_sum = np.zeros(shape)
+        self.hist_count = np.zeros(shape)
+        self.location_sum = np.zeros(shape + (len(shape),)) if track_locations else None
+
+    @classmethod
+    def around(cls, point, bin_size, bins, max_bins=None):
+        """
+        Create a growable accumulator of `bins` bins of `bin_size` in each dimension, centred on `point`, that grows
+        to at most `max_bins` bins per dimension.
+        """
+        edges = [center + size * (np.arange(n_bins + 1) - n_bins / 2)
+                 for center, size, n_bins in zip(point, bin_size, bins)]
+        return cls(edges, growable=True, max_bins=max_bins)
+
+    def add_point(self, point, value):
+        """Add one value at one location. Points outside a fixed grid are ignored, like np.histogramdd does."""
+        if self.growable:
+            if not all(self._reachable(dim, x) for dim, x in enumerate(point)):
+                self.outside += 1  # Checked first, so a skipped point never grows the grid along other dimensions
+                return
+            for dim, x in enumerate(point):
+                if not self.edges[dim][0] <= x <= self.edges[dim][-1]:
+                    self._grow(dim, x)
+        index = []
+        for dim, x in enumerate(point):
+            dim_edges = self.edges[dim]
+            i = int(np.searchsorted(dim_edges, x, side='right')) - 1
+            if x == dim_edges[-1]:
+                i -= 1  # The rightmost edge belongs to the last bin
+            if not 0 <= i < len(dim_edges) - 1:
+                self.outside += 1
+                return
+            index.append(i)
+        index = tuple(index)
+        self.hist_sum[index] += value
+        self.hist_count[index] += 1
+        if self.location_sum is not None:
+            self.location_sum[index] += point
+
+    def add(self, sample, values):
+        """Add a batch of values at the locations of `sample` (shape (D, N)), binning each point once."""
+        sample = np.asarray(sample, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if self.growable and sample.size:
+            # Grow to the furthest points the cap allows, the points beyond it are left outside
+            reachable = np.ones(sample.shape[1], dtype=bool)
+            for dim, coordinates in enumerate(sample):
+                low, high = self._reach(dim)
+                reachable &= np.isfinite(coordinates) & (low <= coordinates) & (coordinates <= high)
+            for dim, coordinates in enumerate(sample[:, reachable]):
+                for x in (coordinates.min(initial=np.inf), coordinates.max(initial=-np.inf)):
+                    if np.isfinite(x) and not self.edges[dim][0] <= x <= self.edges[dim][-1]:
+                        self._grow(dim, x)
+
+        flat_index = flat_bin_index(sample, self.edges)
+        inside = flat_index >= 0
+        self.outside += int(len(inside) - np.count_nonzero(inside))
+        flat_index = flat_index[inside]
+        n_bins = self.hist_sum.size
+        self.hist_sum += np.bincount(flat_index, weights=values[inside], minlength=n_bins).reshape(self.hist_sum.shape)
+        self.hist_count += np.bincount(flat_index, minlength=n_bins).reshape(self.hist_count.shape)
+        if self.location_sum is not None:
+            self.location_sum += np.stack([np.bincount(flat_index, weights=dim[inside], minlength=n_bins)
+                                           for dim in sample], axis=-1).reshape(self.location_sum.shape)
+        return self
+
+    def merge(self, other):
+        """Add the grids of another accumulator over the same edges into this one. Returns self."""
+        if len(self.edges) != len(other.edges) or \
+                not all(np.array_equal(mine, theirs) for mine, theirs in zip(self.edges, other.edges)):
+            raise ValueError("Can only merge histogram accumulators with the same edges")
+        if (self.location_sum is None) != (other.location_sum is None):
+            raise ValueError("Can only merge histogram accumulators that both track locations or both don't")
+        self.hist_sum += other.hist_sum
+        self.hist_count += other.hist_count
+        if self.location_sum is not None:
+            self.location_sum += other.location_sum
+        return self
+
+    def average(self):
+        """Return the average value grid (NaN in empty bins) and its edges, like multi_dim_histogram."""
+        return average_grid(self.hist_sum, self.hist_count), self.edges
+
+    def average_locations(self):
+        """Return the (*bins, D) average location of the points of each bin, NaN in empty bins."""
+        if self.location_sum is None:
+            raise ValueError("Locations are not tracked, create the accumulator with track_locations=True")
+        return average_grid(self.location_sum, self.hist_count[..., np.newaxis])
+
+    def _room(self, dim):
+        """Number of bins the grid can still grow by along dim."""
+        return np.inf if self.max_bins is None else self.max_bins[dim] - (len(self.edges[dim]) - 1)
+
+    def _reach(self, dim):
+        """The range of coordinates along dim the grid covers or can grow to without passing max_bins."""
+        dim_edges = self.edges[dim]
+        room = self._room(dim) * (dim_edges[1] - dim_edges[0])
+        return dim_edges[0] - room, dim_edges[-1] + room
+
+    def _reachable(self, dim, x):
+        low, high = self._reach(dim)
+        return bool(np.isfinite(x)) and low <= x <= high
+
+    def _grow(self, dim, x):
+        dim_edges = self.edges[dim]
+        bin_size = dim_edges[1] - dim_edges[0]
+        n_bins = len(dim_edges) - 1
+        needed = max(int(np.ceil((dim_edges[0] - x) / bin_size)), int(np.ceil((x - dim_edges[-1]) / bin_size)))
+        # Grow by the grid's size for amortized O(1) growth, but by at most half of what the cap leaves, so that
+        # growing towards one side keeps room for the other
+        room = self._room(dim)
+        grow = int(min(max(needed, min(n_bins, room // 2)), room))
+        before, after = (grow, 0) if x < dim_edges[0] else (0, grow)
+        self.edges[dim] = dim_edges[0] + bin_size * np.arange(-before, n_bins + after + 1)
+        pad = [(0, 0)] * self.hist_sum.ndim
+        pad[dim] = (before, after)
+        self.hist_sum = np.pad(self.hist_sum, pad)
+        self.hist_count = np.pad(self.hist_count, pad)
+        if self.location_sum is not None:
+            self.location_sum = np.pad(self.location_sum, pad + [(0, 0)])
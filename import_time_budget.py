@@ -0,0 +1,101 @@
+"""
+Measure the import time of the entry points and check it against a budget.
+
+Every import is timed in a fresh interpreter, the best of a few runs is kept. An entry point also fails its budget
+if importing it loads a module it should only load on first use (plotting, GUI or video libraries).
+
+    python import_time_budget.py [--runs 5] [--detail]
+"""
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+REAL_TIME_DIR = os.path.join(REPO_DIR, 'real_time')
+
+# (name, module, budget in seconds, modules that must not be loaded by the import)
+BUDGETS = [
+    ('headless pipeline', 'localize_source_cli', 0.5, ['matplotlib', 'tkinter', 'cv2', 'sklearn', 'yaml']),
+    ('analysis script', 'shabash_layers_from_csv', 0.6, ['matplotlib', 'tkinter', 'cv2', 'sklearn']),
+    ('capture thread', 'thread_helper', 0.05, ['cv2', 'matplotlib', 'numpy']),
+    ('telemetry hub', 'telemetry_hub', 0.2, ['cv2', 'matplotlib', 'numpy']),
+    ('real-time logger', 'real_time.main_logger', 0.5, ['matplotlib', 'yaml', 'sklearn']),
+]
+
+_MEASURE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(','.join(name for name in {forbidden!r} if name in sys.modules))
+'''
+
+
+def measure_import(module, forbidden, runs=5):
+    """
+    Time `import module` in fresh interpreters.
+
+    Returns:
+        seconds (float or None): Best import time over the runs, None if the import fails.
+        loaded (list of str): The forbidden modules the import loaded.
+        error (str or None): Last line of the error if the import fails.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, REAL_TIME_DIR, os.environ.get('PYTHONPATH', '')]))
+    best, loaded = None, []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-c', _MEASURE.format(module=module, forbidden=forbidden)],
+                                   capture_output=True, text=True, cwd=REPO_DIR, env=env)
+        if completed.returncode != 0:
+            lines = completed.stderr.strip().splitlines()
+            return None, [], lines[-1] if lines else f'exit code {completed.returncode}'
+        seconds, loaded_line = completed.stdout.splitlines()[-2:]
+        best = float(seconds) if best is None else min(best, float(seconds))
+        loaded = [name for name in loaded_line.split(',') if name]
+    return best, loaded, None
+
+
+def import_detail(module):
+    """Print the slowest imports of a module, as reported by python -X importtime."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, REAL_TIME_DIR, os.environ.get('PYTHONPATH', '')]))
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               capture_output=True, text=True, cwd=REPO_DIR, env=env)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = [field.strip() for field in line.split('|')]
+        rows.append((int(cumulative_us), int(self_us), name))
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:10]:
+        print(f'    {cumulative_us / 1e3:8.1f} ms cumulative {self_us / 1e3:8.1f} ms self  {name}')
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Check the import time of the entry points against their budget.')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per entry point, the best is kept')
+    parser.add_argument('--detail', action='store_true', help='also list the slowest imports of each entry point')
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'entry point':<20} {'module':<26} {'import':>9} {'budget':>9}  status")
+    for name, module, budget, forbidden in BUDGETS:
+        seconds, loaded, error = measure_import(module, forbidden, args.runs)
+        if error is not None:
+            status, failed = f'ERROR {error}', True
+            print(f'{name:<20} {module:<26} {"-":>9} {budget * 1e3:7.0f}ms  {status}')
+            continue
+        status = 'ok'
+        if seconds > budget:
+            status = 'OVER BUDGET'
+        if loaded:
+            status = f"{'' if status == 'ok' else status + ', '}eagerly loads {', '.join(loaded)}"
+        failed |= status != 'ok'
+        print(f'{name:<20} {module:<26} {seconds * 1e3:7.1f}ms {budget * 1e3:7.0f}ms  {status}')
+        if args.detail:
+            import_detail(module)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
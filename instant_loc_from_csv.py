@@ -1,17 +1,15 @@
 import ast
 import csv
+import sys
 import time
 
 import numpy as np
-import yaml
-
-import matplotlib.pyplot as plt
-from matplotlib import cm
-import matplotlib.colors as mcolors
 
 from find_shabash import find_shabash
 from find_shabash_2d import find_shabash_2d
+from analysis_config import DEFAULT_CONFIG_PATH, load_config
 from read_csv import load_data_for_graph
+from stage_profiler import StageProfiler
 from subtract_histograms import subtraction_histograms
 from multi_dim_histogram import multi_dim_histogram
 from display_histogram import display_histogram
@@ -19,6 +17,10 @@ from display_histogram import display_histogram
 
 class LocationGraph:
     def __init__(self, config, is_diff_graph=False, diff_graph_label=None):
+        import matplotlib.pyplot as plt
+        from matplotlib import cm
+        import matplotlib.colors as mcolors
+
         self.fig = plt.figure(figsize=(10, 10))
         self.ax = self.fig.add_subplot(1, 1, 1, projection='3d')
         self.axis_labels = ["lon", "lat", "asl"]
@@ -59,6 +61,8 @@ class LocationGraph:
 
     def plot_graph(self):
         """Plot the final graph based on all loaded data."""
+        import matplotlib.pyplot as plt
+
         display_histogram(self.info_histogram, self.plot_edges, self.ax, self.axis_labels, self.cmap, self.norm, self.show_shabash, self.shabash_loc)
         self.ax.set_title(self.config['data'])
 
@@ -66,10 +70,12 @@ class LocationGraph:
         plt.pause(0.1)  # Ensure the figure is drawn
         plt.show(block=False)  # Show the graph in a non-blocking way
 
-def run():
-    with open('csv_lines_config.yaml', 'r') as file:
-        data = yaml.safe_load(file)
-        config = data[data['config']]
+def run(config_path=DEFAULT_CONFIG_PATH, section=None):
+    import matplotlib.pyplot as plt
+
+    config = load_config(config_path, section)
+    # Opt-in: record the time and memory of every stage and write them to config['profile_report']
+    profiler = StageProfiler(enabled=bool(config.get('profile_report')))
 
     two_graphs = []
     two_graphs_labels = []
@@ -77,7 +83,10 @@ def run():
     two_history_infos = []
     for graph_config in config['graphs']:
         location_graph = LocationGraph(config)  # Create a new graph object for each graph
-        location_graph.history_location, location_graph.history_info = load_data_for_graph(config, graph_config)
+        with profiler.stage(f"load {graph_config['title']}", files=len(graph_config['files'])) as record:
+            location_graph.history_location, location_graph.history_info = load_data_for_graph(config, graph_config)
+            record['outputs'] = dict(history_location=location_graph.history_location,
+                                     history_info=location_graph.history_info)
 
         two_history_locations.append(location_graph.history_location)
         two_history_infos.append(location_graph.history_info)
@@ -95,9 +104,13 @@ def run():
             # find_shabash_2d(locs_in_grouping[0], locs_in_grouping[1], infos_in_grouping)
 
         # raw_comm_stregth =
-        find_shabash(*location_graph.history_location, location_graph.history_info, config["find_shabash_bounds"])
+        with profiler.stage(f"find_shabash {graph_config['title']}", history_info=location_graph.history_info):
+            find_shabash(*location_graph.history_location, location_graph.history_info, config["find_shabash_bounds"])
         location_graph.fig.suptitle(graph_config['title'], fontsize=14)  # Set the graph title
-        location_graph.calculate_histogram()
+        with profiler.stage(f"histogram {graph_config['title']}", history_info=location_graph.history_info,
+                            bins=location_graph.histogram_bins) as record:
+            location_graph.calculate_histogram()
+            record['outputs'] = dict(info_histogram=location_graph.info_histogram)
 
         two_graphs.append(location_graph)
         two_graphs_labels.append(graph_config['title'])
@@ -105,11 +118,14 @@ def run():
 
     diff_history_location = [two_history_locations[0][i]+two_history_locations[1][i] for i in [0, 1, 2]]
     diff_history_info = two_history_infos[0] + [-info for info in two_history_infos[1]]
-    find_shabash(*diff_history_location, diff_history_info, config["find_shabash_bounds"])
+    with profiler.stage('find_shabash difference', diff_history_info=diff_history_info):
+        find_shabash(*diff_history_location, diff_history_info, config["find_shabash_bounds"])
 
 
     difference_graph = LocationGraph(config, is_diff_graph=True, diff_graph_label=f'{two_graphs_labels[0]}-{two_graphs_labels[1]}')
-    diff_hist, common_edges = subtraction_histograms(two_graphs[0].history_location, two_graphs[0].history_info, two_graphs[1].history_location, two_graphs[1].history_info, config['histogram_bins_difference_graph'])
+    with profiler.stage('subtraction histograms', bins=config['histogram_bins_difference_graph']) as record:
+        diff_hist, common_edges = subtraction_histograms(two_graphs[0].history_location, two_graphs[0].history_info, two_graphs[1].history_location, two_graphs[1].history_info, config['histogram_bins_difference_graph'])
+        record['outputs'] = dict(diff_hist=diff_hist)
     difference_graph.plot_edges = common_edges
     difference_graph.info_histogram = diff_hist
 
@@ -117,8 +133,12 @@ def run():
     # for location_graph in two_graphs:
     #     location_graph.plot_graph()
 
+    if profiler.enabled:
+        profiler.write_json(config['profile_report'])
+        profiler.print_summary()
     plt.show()  # Keep all graph windows open
 
-run()
+if __name__ == '__main__':  # Guard so process-pool workers can import this module
+    run(*sys.argv[1:3])  # Optional config path and section
 
 # 'shabash_loc': [34.65720, 31.645779, 50]  # Replace with your specific location if needed
\ No newline at end of file
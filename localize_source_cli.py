@@ -0,0 +1,96 @@
+"""
+Headless source localization: run the pipeline of a config section and print the result as JSON.
+
+Never imports matplotlib, so it can batch-process flights on servers without a display:
+
+    python localize_source_cli.py csv_lines_config.yaml --section downlink_show --bootstrap 200 > result.json
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from analysis_config import DEFAULT_CONFIG_PATH, load_config
+from read_csv import load_data_for_graph
+from source_localization import NO_PROFILER, bootstrap_source_location, localize_source
+from stage_profiler import StageProfiler
+
+# Per-bin arrays, only included with --full
+FULL_RESULT_KEYS = ['final_locations', 'final_values', 'layer_groups']
+
+
+def to_json(value):
+    """Convert NumPy arrays and scalars (also nested in lists, tuples and dicts) to JSON-serializable values."""
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def localization_report(config, full=False, bootstrap_replicates=0, profiler=NO_PROFILER):
+    """Run the pipeline of a config section and collect its JSON-serializable report."""
+    result = localize_source(config, profiler)
+    report = {key: value for key, value in result.items() if full or key not in FULL_RESULT_KEYS}
+    report['bins'] = len(result['final_values'])
+    report['values_above_zero'] = int(np.sum(result['final_values'] > 0))
+    report['values_below_zero'] = int(np.sum(result['final_values'] < 0))
+
+    if bootstrap_replicates:
+        (sample1, values1), (sample2, values2) = [load_data_for_graph(config, graph_config)
+                                                  for graph_config in config['graphs'][:2]]
+        with profiler.stage('bootstrap', replicates=bootstrap_replicates):
+            bootstrap = bootstrap_source_location(sample1, values1, sample2, values2,
+                                                  config['histogram_bins_difference_graph'],
+                                                  n_replicates=bootstrap_replicates,
+                                                  confidence=config.get('bootstrap_confidence', 0.95),
+                                                  ground_asl=config.get('ground_asl', 77),
+                                                  count_threshold=config.get('layer_count_threshold', 30),
+                                                  sparse=config.get('sparse_histograms', False),
+                                                  workers=config.get('load_workers'))
+        report['bootstrap'] = {
+            'replicates': bootstrap.n_replicates,
+            'failures': bootstrap.failures,
+            'confidence': bootstrap.confidence,
+            'center': bootstrap.center,
+            'covariance': bootstrap.covariance,
+            'radii': bootstrap.radii,
+            'axes': bootstrap.axes,
+            'estimates': bootstrap.estimates if full else None,
+        }
+    return to_json(report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('config_path', nargs='?', default=DEFAULT_CONFIG_PATH, help='YAML config file')
+    parser.add_argument('--section', help="config section to run, defaults to the file's `config` key")
+    parser.add_argument('--full', action='store_true', help='include the per-bin locations, values and layers')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='REPLICATES',
+                        help='add a bootstrap confidence region of the source location')
+    parser.add_argument('--output', help='write the JSON to this file instead of stdout')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='write the time and memory of every stage to this JSON file and summarize them on stderr')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config_path, args.section)
+    profiler = StageProfiler(enabled=bool(args.profile))
+    report = localization_report(config, full=args.full, bootstrap_replicates=args.bootstrap, profiler=profiler)
+    if profiler.enabled:
+        profiler.write_json(args.profile)
+        profiler.print_summary(file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
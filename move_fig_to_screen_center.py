@@ -1,7 +1,10 @@
-import matplotlib.pyplot as plt
-import tkinter as tk
+import sys
+
 
 def move_fig_to_screen_center(fig):
+    import matplotlib.pyplot as plt
+    import tkinter as tk
+
     # Create a dummy window to get the screen dimensions
     root = tk.Tk()
     screen_width = root.winfo_screenwidth()
@@ -1,25 +1,26 @@
 from typing import Sequence
 import numpy as np
-import matplotlib.pyplot as plt
 
+from histogram_engine import average_grid, binned_statistics, histogram_edges as compute_histogram_edges
+from sparse_histogram import SparseHistogram
 
-def multi_dim_histogram(sample, values, bins: int | Sequence[int]):
+
+def multi_dim_histogram(sample, values, bins: int | Sequence[int], sparse=False):
     # Ensure input arrays have matching lengths
     n_vals = len(values)
     for dim in sample:
         if not len(dim) == n_vals:
             raise ValueError("x, y, and values must have the same length")
 
-    # Create a histogram for sums of values
-    hist_sum, histogram_edges = np.histogramdd(sample.T, bins=bins, range=None, weights=values)
-
-    # Create a histogram for counts of points
-    hist_count, _ = np.histogramdd(sample.T, bins=bins, range=None)
+    # Bin every point once, then take the sums and counts from the same bin indices
+    histogram_edges = compute_histogram_edges(sample, bins)
+    if sparse:
+        # Keep only the occupied bins, avg_hist is then a SparseGrid
+        return SparseHistogram.from_points(sample, values, histogram_edges).average(), histogram_edges
+    hist_sum, hist_count = binned_statistics(sample, values, histogram_edges)
 
     # Avoid division by zero: set bins with no points to NaN
-    with np.errstate(divide='ignore', invalid='ignore'):
-        avg_hist = np.divide(hist_sum, hist_count)
-        avg_hist[hist_count == 0] = np.nan  # Handle empty bins
+    avg_hist = average_grid(hist_sum, hist_count)
 
     print(f'avg_hist={np.unique(avg_hist)}')
 
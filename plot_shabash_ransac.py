@@ -1,9 +1,9 @@
-import matplotlib.pyplot as plt
-import yaml
-from mpl_toolkits.mplot3d import Axes3D
 import numpy as np
 
-def plot_3d_data(final_locations, shabash_loc_2d_and_zs, shabash_loc_3d, ransac_line_point, ransac_direction_vector ):
+from analysis_config import load_config
+
+def plot_3d_data(final_locations, shabash_loc_2d_and_zs, shabash_loc_3d, ransac_line_point, ransac_direction_vector,
+                 real_shabash_loc=None):
     """
     Plot the 3D points, the fitted line, and the plane z=77.
 
@@ -13,7 +13,10 @@ def plot_3d_data(final_locations, shabash_loc_2d_and_zs, shabash_loc_3d, ransac_
     - shabash_loc_3d (array-like): A single 3D point to plot with a red X.
     - coef (array): Coefficients of the fitted line [coef_x, coef_y].
     - intercept (float): Intercept of the fitted line.
+    - real_shabash_loc (array-like or None): Known source location, read from csv_lines_config.yaml if None.
     """
+    import matplotlib.pyplot as plt
+
     # Create a figure and 3D axis
     fig = plt.figure(figsize=(10, 10))
     ax = fig.add_subplot(111, projection='3d')
@@ -33,10 +36,8 @@ def plot_3d_data(final_locations, shabash_loc_2d_and_zs, shabash_loc_3d, ransac_
                color='red', marker='x', s=200, label="Theo Shabash 3D")
 
     # Plot shabash_loc_3d (red X)
-    with open('csv_lines_config.yaml', 'r') as file:
-        data = yaml.safe_load(file)
-        config = data[data['config']]
-    real_shabash_loc = config["real_shabash_loc"]
+    if real_shabash_loc is None:
+        real_shabash_loc = load_config()["real_shabash_loc"]
     print(f'real_shabash_loc={real_shabash_loc}')
     ax.scatter(real_shabash_loc[0], real_shabash_loc[1], real_shabash_loc[2],
                color='black', marker='x', s=200, label="Exp Shabash 3D")
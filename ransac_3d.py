@@ -1,72 +1,123 @@
 import numpy as np
-from sklearn.linear_model import RANSACRegressor
-from sklearn.base import BaseEstimator, RegressorMixin
-# Visualize the result
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-
-from move_fig_to_screen_center import move_fig_to_screen_center
-
-
-# Custom 3D Line Model for RANSAC
-class LineModel3D(BaseEstimator, RegressorMixin):
-    def fit(self, X, y=None):
-        """
-        Fit a line to 3D points using SVD for best-fit line.
-        """
-        # Center the points
-        self.mean_ = np.mean(X, axis=0)
-        centered_points = X - self.mean_
-
-        # Use SVD to find the direction vector (principal axis)
-        _, _, vh = np.linalg.svd(centered_points)
-        self.direction_ = vh[0]  # First singular vector is the line direction
-        return self
-
-    def predict(self, X):
-        """
-        Project points onto the best-fit line.
-        """
-        direction = self.direction_
-        mean = self.mean_
-        projections = np.dot(X - mean, direction)[:, None] * direction + mean
-        return projections
-
-    def score(self, X, y=None):
-        """
-        Compute the score as the inverse of the mean squared distance to the line.
-        """
-        projections = self.predict(X)
-        distances = np.linalg.norm(X - projections, axis=1)
-        return -np.mean(distances)  # Negative because RANSAC maximizes the score
-
-
-def custom_ransac(shabash_loc_2d_and_zs, ground_asl):
+
+
+def fit_line_3d(points):
+    """
+    Fit a line to 3D points using SVD for best-fit line.
+
+    Returns:
+        line_point (ndarray): Mean of the points, a point on the line.
+        direction (ndarray): Unit direction vector of the line (first singular vector).
+    """
+    # Center the points
+    line_point = np.mean(points, axis=0)
+    # Use SVD to find the direction vector (principal axis)
+    _, _, vh = np.linalg.svd(points - line_point)
+    return line_point, vh[0]
+
+
+def line_residuals(points, line_points, directions):
+    """
+    Score points against a batch of lines in one broadcast.
+
+    Parameters:
+        points (ndarray): Array of shape (N, 3).
+        line_points (ndarray): Array of shape (H, 3), a point on each line.
+        directions (ndarray): Array of shape (H, 3), the unit direction of each line.
+
+    Returns:
+        residuals (ndarray): Array of shape (H, N), sum of the absolute coordinate differences between each point and
+            its projection on each line (the residual RANSACRegressor used for 3D targets).
+        distances (ndarray): Array of shape (H, N), Euclidean distance of each point to each line.
+    """
+    offsets = points[np.newaxis, :, :] - line_points[:, np.newaxis, :]
+    along = np.einsum('hnd,hd->hn', offsets, directions)
+    perpendicular = offsets - along[..., np.newaxis] * directions[:, np.newaxis, :]
+    return np.abs(perpendicular).sum(axis=-1), np.linalg.norm(perpendicular, axis=-1)
+
+
+def ransac_line_3d(points, residual_threshold=5.0, max_trials=1000, random_state=42):
+    """
+    Fit a 3D line with RANSAC, scoring every two-point hypothesis at once.
+
+    All point pairs are tried when there are at most max_trials of them, otherwise max_trials random pairs. The
+    hypothesis with the most inliers wins, ties going to the lowest mean inlier distance, and its inliers are refit
+    with one SVD.
+
+    Returns:
+        line_point (ndarray): A point on the fitted line.
+        direction (ndarray): Unit direction vector of the fitted line.
+        inlier_mask (ndarray): Boolean array of shape (N,), the points of the consensus set.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n_points = len(points)
+    if n_points < 2:
+        raise ValueError(f"Need at least 2 points to fit a line, got {n_points}")
+
+    # Two-point hypotheses as one (H, 2) array of point indices
+    if n_points * (n_points - 1) // 2 <= max_trials:
+        pairs = np.stack(np.triu_indices(n_points, k=1), axis=-1)
+    else:
+        rng = np.random.default_rng(random_state)
+        first = rng.integers(n_points, size=max_trials)
+        second = (first + rng.integers(1, n_points, size=max_trials)) % n_points  # Never the same point twice
+        pairs = np.stack([first, second], axis=-1)
+
+    starts, ends = points[pairs[:, 0]], points[pairs[:, 1]]
+    lengths = np.linalg.norm(ends - starts, axis=-1)
+    valid = lengths > 0  # Duplicate points don't define a line
+    if not valid.any():
+        raise ValueError("All points coincide, cannot fit a line")
+    starts, ends, lengths = starts[valid], ends[valid], lengths[valid]
+    directions = (ends - starts) / lengths[:, np.newaxis]
+
+    residuals, distances = line_residuals(points, (starts + ends) / 2, directions)
+    inliers = residuals <= residual_threshold
+    inlier_counts = inliers.sum(axis=1)
+    mean_distances = np.where(inliers, distances, 0).sum(axis=1) / inlier_counts
+    best = np.lexsort((mean_distances, -inlier_counts))[0]
+
+    # Refine on the consensus set
+    inlier_mask = inliers[best]
+    line_point, direction = fit_line_3d(points[inlier_mask])
+    return line_point, direction, inlier_mask
+
+
+def ground_intersection(line_point, direction_vector, ground_asl):
+    """Return the (x, y) at which a 3D line crosses the z=ground_asl plane."""
+    t = (ground_asl - line_point[2]) / direction_vector[2]
+    return line_point[0] + t * direction_vector[0], line_point[1] + t * direction_vector[1]
+
+
+def custom_ransac(shabash_loc_2d_and_zs, ground_asl, plot=True):
     # Convert list to numpy array
     points = np.array(shabash_loc_2d_and_zs)
 
     # Apply RANSAC to fit the 3D line
-    ransac = RANSACRegressor(estimator=LineModel3D(), min_samples=2, residual_threshold=5.0, random_state=42)
-
-    # ransac.fit(points, np.zeros(points.shape[0]))  # Dummy y, not used
-    ransac.fit(points, points)  # Use points themselves as the target
-
+    line_point, direction_vector, inlier_mask = ransac_line_3d(points, residual_threshold=5.0)
 
-    # Extract the line parameters
-    line_point = ransac.estimator_.mean_  # A point on the line
-    direction_vector = ransac.estimator_.direction_  # Direction vector of the line
     print(f"Point on Line: {line_point}")
     print(f"Direction Vector: {direction_vector}")
 
     # Find intersection with z=ground_asl plane
-    t = (ground_asl - line_point[2]) / direction_vector[2]
-    intersection_x = line_point[0] + t * direction_vector[0]
-    intersection_y = line_point[1] + t * direction_vector[1]
+    intersection_x, intersection_y = ground_intersection(line_point, direction_vector, ground_asl)
 
     print(f"Intersection with z=ground_asl at: x={intersection_x}, y={intersection_y}, z={ground_asl}")
 
+    if plot:
+        plot_ransac_line(points, inlier_mask, line_point, direction_vector, (intersection_x, intersection_y), ground_asl)
+
+    return (intersection_x, intersection_y, ground_asl), line_point, direction_vector
+
 
+def plot_ransac_line(points, inlier_mask, line_point, direction_vector, intersection, ground_asl):
+    """Plot the layer estimates, the RANSAC inliers, the fitted line and its intersection with z=ground_asl."""
+    # Visualize the result
+    import matplotlib.pyplot as plt
+    from move_fig_to_screen_center import move_fig_to_screen_center
 
+    points = np.asarray(points)
+    intersection_x, intersection_y = intersection
     fig = plt.figure(figsize=(10, 10))
     ax = fig.add_subplot(111, projection='3d')
 
@@ -74,7 +125,6 @@ def custom_ransac(shabash_loc_2d_and_zs, ground_asl):
     ax.scatter(points[:, 0], points[:, 1], points[:, 2], color='blue', label='Data Points')
 
     # Plot inliers
-    inlier_mask = ransac.inlier_mask_
     ax.scatter(points[inlier_mask, 0], points[inlier_mask, 1], points[inlier_mask, 2], color='green', label='Inliers')
 
     # Plot the fitted line
@@ -95,5 +145,3 @@ def custom_ransac(shabash_loc_2d_and_zs, ground_asl):
     # fig.canvas.manager.window.move(200, 200)
     move_fig_to_screen_center(fig)
     plt.show()
-
-    return (intersection_x, intersection_y, ground_asl), line_point, direction_vector
@@ -1,40 +1,164 @@
-import ast
-import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import numpy as np
 
+from chunked_columns import GrowableArray, column_cells, float_cells, int_cells
+from csv_cache import MISSING_NANO_TIME, load_columns, load_rssi_frequencies
+from csv_index import iter_row_chunks, load_row_index
+from rssi_matrix import build_rssi_matrix, rssi_info
+from time_align import asof_join
+from time_index import TIME_BOUND_KEYS, file_row_range, resolve_time_bounds
+
+INFO_COLUMNS = {'downlink': 'downLinkPercent', 'uplink': 'upLinkPercent'}
+DEFAULT_MAX_TIME_GAP_NS = 100_000_000  # Rows of two recordings further apart than this (0.1s) are not matched
+
 
 def load_data_for_graph(config, graph_config):
-    history_location = [[], [], []]
-    history_info = []
-    for file_config in graph_config['files']:
-        load_data_from_csv(config, file_config['csv_file_path'], history_location, history_info, file_config['start_row'],
-                  file_config['end_row'])  # Load data for the file range
-    history_location = np.array(history_location)
-    history_info = np.array(history_info)
+    """
+    Load and concatenate, in config order, the data of all the files of a graph.
+
+    Files are loaded concurrently in a process pool unless the graph has a single file or config['load_workers']
+    is 1. Each worker returns NumPy arrays, which are concatenated once at the end.
+    """
+    files = graph_config['files']
+    workers = min(len(files), config.get('load_workers') or os.cpu_count() or 1)
+    if workers > 1:
+        build_file_caches(config, files)
+        # Time bounds are resolved here, the workers would otherwise all build the same time index
+        files = [resolve_time_bounds(config, file_config) for file_config in files]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(partial(load_data_for_file, config), files))  # map keeps config order
+    else:
+        results = [load_data_for_file(config, file_config) for file_config in files]
+
+    history_location = np.concatenate([history_location for history_location, _ in results], axis=1)
+    history_info = np.concatenate([history_info for _, history_info in results])
     return history_location, history_info
 
 
-def load_data_from_csv(config, csv_file_path, history_location, history_info, start_row=None, end_row=None):
-    """Load data from a CSV file, selecting rows by range."""
-
-    with open(csv_file_path, mode='r') as csvfile:
-        reader = list(csv.DictReader(csvfile))  # Convert to list to enable slicing
-        for row in reader[start_row:end_row]:  # Use row slicing
-            if row['lat'] and row['lon'] and row['aboveSeaLevel']:  # Ensure no missing data
-                if config['data'] == 'downlink':
-                    info = float(row['downLinkPercent'])
-                elif config['data'] == 'uplink':
-                    info = float(row['upLinkPercent'])
-                elif config['data'] == 'rssi':
-                    data_list = ast.literal_eval(row['signalInterference'])
-                    info = max(item['rssi'] for item in data_list)
-                    # info = sum(item['rssi'] for item in data_list)/len([item['rssi'] for item in data_list])
-                    # print(info)
-
-                if not config["filter_middle_info"] or info <= config['low_info_ceil'] or config["high_info_floor"] <= info:
-                    history_location[0].append(float(row['lon']))
-                    history_location[1].append(float(row['lat']))
-                    history_location[2].append(float(row['aboveSeaLevel']))
-                    history_info.append(info)
+def build_file_caches(config, files):
+    """
+    Build the sidecar caches the file entries of a graph read, once per distinct CSV, before they are loaded in a
+    process pool. Several entries may cut windows out of the same recording, and workers building its cold cache
+    at the same time would write the same files.
+    """
+    csv_file_paths = {}  # dict keeps the config order, a path is only built once
+    for file_config in files:
+        ranged = any(file_config.get(key) is not None for key in ['start_row', 'end_row', *TIME_BOUND_KEYS])
+        csv_file_paths[file_config['csv_file_path']] = csv_file_paths.get(file_config['csv_file_path']) or ranged
+        if file_config.get('rssi_csv_file_path'):
+            csv_file_paths.setdefault(file_config['rssi_csv_file_path'], False)  # Read whole, never by range
+
+    for csv_file_path, ranged in csv_file_paths.items():
+        if config.get('csv_cache', True):
+            load_columns(csv_file_path)
+        elif ranged:
+            load_row_index(csv_file_path)  # Only ranges seek through the row index
+
+
+def load_data_for_file(config, file_config):
+    """
+    Load the row range of a single file entry of a graph config as (3, N) location and (N,) info arrays.
+
+    With data 'rssi', an entry may name the recording holding the RSSI with `rssi_csv_file_path`. Its rows are
+    matched to the rows of `csv_file_path` by videoNanoTime (see time_align.asof_join), so the row range only
+    applies to `csv_file_path` and no row offsets between the recordings are needed.
+
+    The range is given by rows or by time, see time_index.file_row_range.
+    """
+    start_row, end_row = file_row_range(config, file_config)
+    rssi_csv_file_path = file_config.get('rssi_csv_file_path')
+    if config.get('csv_cache', True):
+        return load_data_from_cache(config, file_config['csv_file_path'], start_row, end_row, rssi_csv_file_path)
+    return load_data_from_csv(config, file_config['csv_file_path'], start_row, end_row, rssi_csv_file_path)
+
+
+def load_data_from_cache(config, csv_file_path, start_row=None, end_row=None, rssi_csv_file_path=None):
+    """
+    Load data from the columnar cache of a CSV file, selecting rows by range.
+
+    With data 'rssi' and an rssi_csv_file_path, the RSSI of each row is taken from the row of that recording closest
+    in videoNanoTime (at most config['max_time_gap_ns'] away, rows without a match are dropped).
+
+    Returns:
+        history_location (np.ndarray): Array of shape (3, N) holding lon, lat and asl.
+        history_info (np.ndarray): Array of shape (N,) holding the info selected by config['data'].
+    """
+    columns = {name: values[start_row:end_row] for name, values in load_columns(csv_file_path).items()}
+    if config['data'] == 'rssi' and rssi_csv_file_path:
+        info = align_rssi(config, columns['videoNanoTime'], *load_rssi_channel(config, rssi_csv_file_path))
+    elif config['data'] == 'rssi':
+        info = rssi_info(config, columns['rssi'], load_rssi_frequencies(csv_file_path))
+    elif config['data'] in INFO_COLUMNS:
+        info = columns[INFO_COLUMNS[config['data']]]
+    else:
+        raise ValueError(f"Unknown data type: {config['data']}")
+    return select_points(config, columns['lon'], columns['lat'], columns['aboveSeaLevel'], info)
 
+
+def load_data_from_csv(config, csv_file_path, start_row=None, end_row=None, rssi_csv_file_path=None):
+    """
+    Load data from a CSV file, selecting rows by range.
+
+    The range is parsed in fixed-size blocks of rows straight into growable NumPy buffers, so no per-row Python
+    objects outlive their block. Returns the same arrays as load_data_from_cache.
+    """
+    if config['data'] not in INFO_COLUMNS and config['data'] != 'rssi':
+        raise ValueError(f"Unknown data type: {config['data']}")
+
+    rssi_channel = None
+    if config['data'] == 'rssi' and rssi_csv_file_path:
+        rssi_channel = load_rssi_channel(config, rssi_csv_file_path)
+    lon, lat, asl, info = (GrowableArray(np.float64) for _ in range(4))
+    for chunk in iter_row_chunks(csv_file_path, start_row, end_row):  # Seek to start_row and stream only the range
+        if rssi_channel is not None:
+            chunk_info = align_rssi(config, int_cells(column_cells(chunk, 'videoNanoTime'), MISSING_NANO_TIME),
+                                    *rssi_channel)
+        elif config['data'] == 'rssi':
+            chunk_info = rssi_info(config, *build_rssi_matrix(column_cells(chunk, 'signalInterference')))
+        else:
+            chunk_info = float_cells(column_cells(chunk, INFO_COLUMNS[config['data']]))
+        chunk_location, chunk_info = select_points(config, float_cells(column_cells(chunk, 'lon')),
+                                                   float_cells(column_cells(chunk, 'lat')),
+                                                   float_cells(column_cells(chunk, 'aboveSeaLevel')), chunk_info)
+        for buffer, values in zip((lon, lat, asl, info), (*chunk_location, chunk_info)):
+            buffer.extend(values)
+    return np.stack([lon.array, lat.array, asl.array]), info.array.copy()
+
+
+def load_rssi_channel(config, csv_file_path):
+    """
+    Load the whole RSSI channel of a recording, reduced per row, with its timestamps.
+
+    Returns:
+        nano_times (np.ndarray): int64 videoNanoTime of each row.
+        info (np.ndarray): float64 reduced RSSI of each row, see rssi_matrix.rssi_info.
+    """
+    if config.get('csv_cache', True):
+        columns = load_columns(csv_file_path)
+        return np.asarray(columns['videoNanoTime']), rssi_info(config, columns['rssi'],
+                                                               load_rssi_frequencies(csv_file_path))
+
+    nano_times, info = GrowableArray(np.int64), GrowableArray(np.float64)
+    for chunk in iter_row_chunks(csv_file_path):
+        nano_times.extend(int_cells(column_cells(chunk, 'videoNanoTime'), MISSING_NANO_TIME))
+        info.extend(rssi_info(config, *build_rssi_matrix(column_cells(chunk, 'signalInterference'))))
+    return nano_times.array, info.array
+
+
+def align_rssi(config, nano_times, rssi_nano_times, rssi):
+    """Return the RSSI of the row of the RSSI recording matched to each of nano_times, NaN where none is."""
+    return asof_join(nano_times, rssi_nano_times, rssi, config.get('max_time_gap_ns', DEFAULT_MAX_TIME_GAP_NS))
+
+
+def select_points(config, lon, lat, asl, info):
+    """Drop rows with missing data and, if config['filter_middle_info'], rows with middle info values."""
+    keep = ~(np.isnan(lon) | np.isnan(lat) | np.isnan(asl) | np.isnan(info))  # Ensure no missing data
+    if config["filter_middle_info"]:
+        keep &= (info <= config['low_info_ceil']) | (config["high_info_floor"] <= info)
+
+    history_location = np.stack([lon[keep], lat[keep], asl[keep]])
+    history_info = np.asarray(info[keep])
+    return history_location, history_info
@@ -0,0 +1,75 @@
+import math
+import time
+
+
+class LiveCanvas:
+    """
+    Blitted redraws of a live figure, at most max_redraw_hz times per second.
+
+    The figure is drawn in full once (and again whenever it must be, e.g. after the view or the axis limits
+    changed), saving everything but the animated artists as a background. A redraw then only restores the background
+    and draws the animated artists over it, so its cost doesn't depend on the rest of the figure. The graphs take in
+    data on every update but only refresh their artists and redraw when due(), the data rate never sets the drawing
+    rate.
+    """
+
+    def __init__(self, fig, artists, max_redraw_hz=10):
+        """
+        Parameters:
+            fig (matplotlib.figure.Figure): The live figure, already shown.
+            artists (list): The artists updated in place, they are marked animated and drawn on every redraw.
+            max_redraw_hz (float or None): Redraw-rate cap, None for no cap.
+        """
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.artists = list(artists)
+        for artist in self.artists:
+            artist.set_animated(True)
+        self.min_interval_s = 1 / max_redraw_hz if max_redraw_hz else 0
+        self.background = None
+        self.needs_full_draw = True
+        self.pending = False  # Data changed since the last redraw
+        self.last_redraw = -math.inf
+        self.redraws = 0
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def invalidate(self):
+        """Ask for a full redraw, for changes outside the animated artists (axis limits, titles...)."""
+        self.needs_full_draw = True
+
+    def changed(self):
+        """Note that the animated artists changed."""
+        self.pending = True
+
+    def due(self):
+        """Whether something changed and the rate cap allows a redraw now."""
+        return self.pending and time.monotonic() - self.last_redraw >= self.min_interval_s
+
+    def idle(self):
+        """Process the window's events without drawing, keeping it responsive between redraws."""
+        self.canvas.flush_events()
+
+    def redraw(self):
+        if self.needs_full_draw or self.background is None or not self.canvas.supports_blit:
+            self.needs_full_draw = False
+            self.canvas.draw()  # Calls _on_draw, which saves the background and draws the artists over it
+        else:
+            self.canvas.restore_region(self.background)
+            self._draw_artists()
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+        self.pending = False
+        self.last_redraw = time.monotonic()
+        self.redraws += 1
+
+    def _on_draw(self, event):
+        # Any full draw (ours, a resize, rotating a 3D view) renews the background
+        if self.canvas.supports_blit:
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            if hasattr(artist, 'do_3d_projection'):
+                artist.do_3d_projection()  # 3D artists project their points only when their axes are drawn
+            self.fig.draw_artist(artist)
@@ -1,11 +1,11 @@
 import matplotlib
 import matplotlib.pyplot as plt
-import time  # Add time import to track elapsed time
-import matplotlib.cm as cm
 import matplotlib.colors as mcolors
+import numpy as np
 
-from multi_dim_histogram import multi_dim_histogram
-# from display_histogram import display_histogram_3d
+from display_histogram import histogram_points
+from histogram_engine import HistogramAccumulator
+from real_time.live_canvas import LiveCanvas
 
 matplotlib.use('Qt5Agg')  # Try TkAgg, or you can use 'Qt5Agg' or 'Agg'
 
@@ -13,61 +13,79 @@ class LocationGraph:
     def __init__(self, config):
         plt.ion()  # Turn on interactive mode for dynamic updating
         self.fig = plt.figure(figsize=(10, 5))
-        if config['show_uplink_flag']:
-            self.uplink_hist_ax = self.fig.add_subplot(1, 2, 1, projection='3d')
-        self.downlink_hist_ax = self.fig.add_subplot(1, 2, 2, projection='3d')
         self.axis_labels = ["lon", "lat", "asl"]
-        self.cmap = cm.get_cmap('viridis')  # Choose a colormap
+        self.cmap = matplotlib.colormaps['viridis']  # Choose a colormap
         self.norm = mcolors.Normalize(vmin=0, vmax=100)  # Fixed normalization for the range
+        self.shabash_loc = config['shabash_loc']
+        self.config = config
+
+        # One persistent scatter per histogram, its points and colors are updated in place
+        self.hist_axes = {}
+        self.hist_scatters = {}
+        if config['show_uplink_flag']:
+            self.hist_axes['uplink'] = self.fig.add_subplot(1, 2, 1, projection='3d')
+        self.hist_axes['downlink'] = self.fig.add_subplot(1, 2, 2, projection='3d')
+        for name, ax in self.hist_axes.items():
+            ax.set_title(name)
+            ax.set_xlabel(self.axis_labels[0])
+            ax.set_ylabel(self.axis_labels[1])
+            ax.set_zlabel(self.axis_labels[2])
+            ax.plot(self.shabash_loc[0], self.shabash_loc[1], self.shabash_loc[2], 'ro')  # show evo
+            self.hist_scatters[name] = ax.scatter(np.empty(0), np.empty(0), np.empty(0), s=50, alpha=0.4)
 
         # location color bar:
         sm = plt.cm.ScalarMappable(cmap=self.cmap, norm=self.norm)
         sm.set_array([])
-        if config['show_uplink_flag']:
-            cbar = self.fig.colorbar(sm, ax=[self.uplink_hist_ax, self.downlink_hist_ax], shrink=0.7, aspect=20, location='right')
-        else:
-            cbar = self.fig.colorbar(sm, ax=[self.downlink_hist_ax], shrink=0.7, aspect=20, location='right')
+        cbar = self.fig.colorbar(sm, ax=list(self.hist_axes.values()), shrink=0.7, aspect=20, location='right')
         cbar.set_label('Values (0-100)')
 
         self.histogram_bins = config['histogram_bins']
+        self.histogram_bin_size = config['histogram_bin_size']
+        self.histogram_max_bins = config.get('histogram_max_bins')
 
-        self.history_uplink = []
-        self.history_downlink = []
-        self.history_location = [[], [], []]
-        self.history_location = [[], [], []]
-
-        self.shabash_loc = config['shabash_loc']
-        self.config = config
-
-
-
+        # Running sum/count grids, created around the first location and grown as the drone flies out of them
+        self.histograms = {'uplink': None, 'downlink': None}
+        self.plotted_bounds = {}  # Axis limits currently shown, per histogram
 
+        plt.show(block=False)
+        self.canvas = LiveCanvas(self.fig, self.hist_scatters.values(), config.get('max_redraw_hz', 10))
 
     def update(self, telemetry):
-
-
+        """Add the telemetry's link percents at its location, the figure is redrawn at most max_redraw_hz a second."""
         current_location = telemetry['lon'], telemetry['lat'], telemetry['aboveSeaLevel']
-        current_uplink = telemetry['upLinkPercent']
-        current_downlink = telemetry['downLinkPercent']
-
-        if None not in current_location:
-            self.history_uplink.append(current_uplink)
-            self.history_downlink.append(current_downlink)
-            self.history_location[0].append(float(current_location[0]))
-            self.history_location[1].append(float(current_location[1]))
-            self.history_location[2].append(float(current_location[2]))
-
-        if None not in current_location:
-            if self.config['show_uplink_flag']:
-                uplink_hist, edges = multi_dim_histogram(self.history_location, self.history_uplink, bins=self.histogram_bins)
-                self.uplink_hist_ax.clear()
-                # display_histogram_3d(uplink_hist, edges, self.uplink_hist_ax, self.axis_labels, self.cmap, self.norm, self.shabash_loc)
-                self.uplink_hist_ax.set_title('uplink')
-
-            downlink_hist, edges = multi_dim_histogram(self.history_location, self.history_downlink, bins=self.histogram_bins)
-            self.downlink_hist_ax.clear()
-            # display_histogram_3d(downlink_hist, edges, self.downlink_hist_ax, self.axis_labels, self.cmap, self.norm, self.shabash_loc)
-            self.downlink_hist_ax.set_title('downlink')
-
-        self.fig.canvas.draw_idle()
-        plt.pause(0.1)
+        current_values = {'uplink': telemetry['upLinkPercent'], 'downlink': telemetry['downLinkPercent']}
+
+        # lon and lat of 0 is the GPS without a fix, common at startup, it mustn't become the grid's centre
+        if None not in current_location and current_location[:2] != (0, 0):
+            current_location = tuple(float(coordinate) for coordinate in current_location)
+            if self.histograms['downlink'] is None:
+                for name in self.histograms:
+                    self.histograms[name] = HistogramAccumulator.around(current_location, self.histogram_bin_size,
+                                                                        self.histogram_bins, self.histogram_max_bins)
+            for name, value in current_values.items():
+                if value is not None:
+                    self.histograms[name].add_point(current_location, value)
+                    self.canvas.changed()
+
+        if self.canvas.due():
+            self._update_artists()
+            self.canvas.redraw()
+        else:
+            self.canvas.idle()
+
+    def _update_artists(self):
+        # Averaging is only done for the frames that are drawn, not for every telemetry message
+        for name, scatter in self.hist_scatters.items():
+            hist, edges = self.histograms[name].average()
+            x, y, z, values = histogram_points(hist, edges)
+            scatter._offsets3d = (x, y, z)
+            scatter.set_facecolor(self.cmap(self.norm(values)))
+
+            bounds = tuple((float(dim_edges[0]), float(dim_edges[-1])) for dim_edges in edges)
+            if bounds != self.plotted_bounds.get(name):  # The grid grew, the static axes must be redrawn
+                ax = self.hist_axes[name]
+                ax.set_xlim(*bounds[0])
+                ax.set_ylim(*bounds[1])
+                ax.set_zlim(*bounds[2])
+                self.plotted_bounds[name] = bounds
+                self.canvas.invalidate()
@@ -1,14 +1,9 @@
 from argparse import ArgumentParser
-from queue import Queue
-import threading
 import cv2
 from cv2 import imshow
-import yaml
 
-from rssi_graph import RssiGraph
-from real_time.location_graph import LocationGraph
-from thread_helper import CaptureThread
-from thread_helper import TelemetryThread
+from thread_helper import CaptureThread, FrameRing
+from telemetry_hub import TelemetryHub
 
 # based on eyesatop_basic_example
 
@@ -32,39 +27,47 @@ if __name__ == '__main__':
     # If you've buily opencv with cuvid support, or support for another hardware decoder, specify it here:
     # os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "video_codec;h264_cuvid"
 
-    # Initialize a threading lock to synchronize threads
-    lock = threading.Lock()
-
     closing = False
-    capture_queue = Queue(2)
-    capture_thread = CaptureThread('tcp://127.0.0.1:{}?listen'.format(ns.video_port), capture_queue, lock)
-    telemetry_thread = TelemetryThread(ns.telemetry_port, ns.telemetry_bufsize, lock)
+    # Frames are decoded into a few reusable buffers and shown in place, without a copy per frame
+    frame_ring = FrameRing()
+    capture_thread = CaptureThread('tcp://127.0.0.1:{}?listen'.format(ns.video_port), frame_ring)
+    telemetry_hub = TelemetryHub(ns.telemetry_port, max_message_bytes=ns.telemetry_bufsize)
+    # The live graphs only need recent telemetry, when they fall behind they drop their oldest messages
+    graph_telemetry = telemetry_hub.subscribe('live graphs', maxsize=256, policy='drop_oldest')
 
     capture_thread.start()
-    telemetry_thread.start()
-    timeout = None
-    last_frame = capture_queue.get(timeout=timeout)
+    telemetry_hub.start()
+
+    import yaml
 
     with open(f'config.yaml', 'r') as f:
         config = yaml.safe_load(f)
 
+    # The graphs pull in matplotlib and its Qt backend, only import them once they are needed
     if config['show_rssi_flag']:
-        rssi_graph = RssiGraph()
+        from rssi_graph import RssiGraph
+        rssi_graph = RssiGraph(max_redraw_hz=config.get('max_redraw_hz', 10))
+    from real_time.location_graph import LocationGraph
     location_graph = LocationGraph(config)
 
+    frame_sequence = 0  # Sequence number of the last frame shown
     while not closing and not capture_thread.isFinished() :
-        current_frame = capture_queue.get(timeout=timeout)
-        telemetry = telemetry_thread.getLatestAsDict()
-        # if config['show_rssi_flag']:
-        #     rssi_graph.update(telemetry)
-        # location_graph.update(telemetry)
+        frame = frame_ring.latest(after=frame_sequence)
+        if frame is None:
+            break  # Video capture ended
+        # Every telemetry message since the last frame, the graphs take them all in but redraw at a capped rate
+        for telemetry in graph_telemetry.drain():
+            if config['show_rssi_flag']:
+                rssi_graph.update(telemetry)
+            location_graph.update(telemetry)
        
-        imshow("EyesAtop example", current_frame)
+        with frame:
+            frame_sequence = frame.sequence
+            imshow("EyesAtop example", frame.image)
         if cv2.waitKey(1) == 27:
             closing = True 
-        last_frame = current_frame
         
     capture_thread.close()
-    telemetry_thread.close()
+    telemetry_hub.close()
     capture_thread.join()
-    telemetry_thread.join()
\ No newline at end of file
+    print(f"video frames: {frame_ring.statistics()}")
\ No newline at end of file
@@ -1,23 +1,51 @@
+from collections import deque
+
 import matplotlib
 import matplotlib.pyplot as plt
-import time  # Add time import to track elapsed time
+import numpy as np
+
+from real_time.live_canvas import LiveCanvas
+
 matplotlib.use('Qt5Agg')  # Try TkAgg, or you can use 'Qt5Agg' or 'Agg'
 
 class RssiGraph:
-    def __init__(self,  max_past_data_length=5):
+    def __init__(self,  max_past_data_length=5, max_redraw_hz=10):
         plt.ion()  # Turn on interactive mode for dynamic updating
         fig, (ax1, ax2, ax3) = plt.subplots(1, 3, figsize=(8, 5), gridspec_kw={'width_ratios': [5, 1, 1]})
+        self.fig = fig
         self.ax1, self.ax2, self.ax3 = ax1, ax2, ax3
         self.max_past_data_length = max_past_data_length
         self.previous_rssi = None
         self.previous_uplink = None
         self.previous_downlink = None
-        self.history_rssi = []
-        self.history_frequencies = []
-        self.history_uplink = []
-        self.history_downlink = []
+        # The current values are the last entries of the histories
+        self.history_rssi = deque(maxlen=max_past_data_length + 1)
+        self.history_frequencies = deque(maxlen=max_past_data_length + 1)
+        self.history_uplink = deque(maxlen=max_past_data_length + 1)
+        self.history_downlink = deque(maxlen=max_past_data_length + 1)
+
+        self.ax1.set_xlabel("Frequency (MHz)")
+        self.ax1.set_ylabel("RSSI (dBm)")
+        self.ax1.set_title("RSSI vs Frequency over Time")
+        self.ax1.grid(True)
+        for ax, title in [(self.ax2, "UpLink"), (self.ax3, "DownLink")]:
+            ax.set_ylim(-5, 105)
+            ax.set_title(title)
+            ax.set_xticks([])
+
+        # One persistent artist per kind of point, their offsets and colors are updated in place
+        self.past_rssi_scatter = self.ax1.scatter(np.empty(0), np.empty(0), marker='o')
+        self.current_rssi_scatter = self.ax1.scatter(np.empty(0), np.empty(0), marker='o', color='k')
+        self.uplink_scatter = self.ax2.scatter(np.empty(0), np.empty(0), marker='o')
+        self.downlink_scatter = self.ax3.scatter(np.empty(0), np.empty(0), marker='o')
+        self.rssi_limits = None  # (min frequency, max frequency, min rssi, max rssi) currently shown
+
+        plt.show(block=False)
+        self.canvas = LiveCanvas(fig, [self.past_rssi_scatter, self.current_rssi_scatter, self.uplink_scatter,
+                                       self.downlink_scatter], max_redraw_hz)
 
     def update(self, telemetry):
+        """Take in a telemetry message, the figure is redrawn at most max_redraw_hz times a second."""
         # Extract signal interference data (frequency and RSSI)
         current_signal_interference = telemetry['signalInterference']
         current_frequencies = [entry['frequencyFrom'] for entry in current_signal_interference]
@@ -25,7 +53,6 @@ class RssiGraph:
         current_uplink = telemetry['upLinkPercent']
         current_downlink = telemetry['downLinkPercent']
 
-
         rssi_updated = current_rssi != self.previous_rssi
         uplink_updated = current_uplink != self.previous_uplink
         downlink_updated = current_downlink != self.previous_downlink
@@ -33,66 +60,71 @@ class RssiGraph:
         self.previous_uplink = current_uplink
         self.previous_downlink = current_downlink
 
-        if not (rssi_updated or uplink_updated or downlink_updated):
-            return  # Skip if no updates have occurred
-
+        # The deques drop the oldest data once they exceed the limit
         if rssi_updated:
             self.history_rssi.append(current_rssi)
             self.history_frequencies.append(current_frequencies)
-            if len(self.history_rssi) > self.max_past_data_length:
-                self.history_rssi.pop(0)  # Remove the oldest data if we exceed the limit
-                self.history_frequencies.pop(0)
         if uplink_updated:
             self.history_uplink.append(current_uplink)
-            if len(self.history_uplink) > self.max_past_data_length:
-                self.history_uplink.pop(0)
         if downlink_updated:
             self.history_downlink.append(current_downlink)
-            if len(self.history_downlink) > self.max_past_data_length:
-                self.history_downlink.pop(0)
+        if rssi_updated or uplink_updated or downlink_updated:
+            self.canvas.changed()
 
+        if self.canvas.due():
+            self._update_artists()
+            self.canvas.redraw()
+        else:
+            self.canvas.idle()
 
+    def _update_artists(self):
+        alpha_multiplier = 1 / self.max_past_data_length / 3
 
+        if self.history_rssi:
+            *past_rssi, current_rssi = self.history_rssi
+            *past_frequencies, current_frequencies = self.history_frequencies
+            # All past spectra in one artist, older ones fainter
+            alphas = np.repeat((np.arange(len(past_rssi)) + 1) * alpha_multiplier, [len(rssi) for rssi in past_rssi])
+            self.past_rssi_scatter.set_offsets(_points(_flatten(past_frequencies), _flatten(past_rssi)))
+            self.past_rssi_scatter.set_facecolor(_colors('b', alphas))
+            self.current_rssi_scatter.set_offsets(_points(current_frequencies, current_rssi))
+            self._fit_rssi_limits(_flatten(self.history_frequencies), _flatten(self.history_rssi))
 
+        for scatter, history, color in [(self.uplink_scatter, self.history_uplink, 'g'),
+                                        (self.downlink_scatter, self.history_downlink, 'r')]:
+            if not history:
+                continue
+            values = [np.nan if value is None else value for value in history]
+            alphas = np.arange(len(values) - 1) * alpha_multiplier + 0.2
+            scatter.set_offsets(_points(np.zeros(len(values)), values))
+            scatter.set_facecolor(np.concatenate([_colors(color, alphas), _colors('k', [1.0])]))
 
-        alpha_multiplier = 1 / self.max_past_data_length / 3
+    def _fit_rssi_limits(self, frequencies, rssi):
+        """Widen the RSSI axes when points fall outside them, which needs a full redraw."""
+        frequencies, rssi = np.asarray(frequencies, dtype=float), np.asarray(rssi, dtype=float)
+        if len(rssi) == 0:
+            return
+        limits = self.rssi_limits
+        if limits is not None and limits[0] <= frequencies.min() and frequencies.max() <= limits[1] and \
+                limits[2] <= rssi.min() and rssi.max() <= limits[3]:
+            return
+        frequency_margin = max(frequencies.max() - frequencies.min(), 1) * 0.05
+        self.rssi_limits = (frequencies.min() - frequency_margin, frequencies.max() + frequency_margin,
+                            rssi.min() - 5, rssi.max() + 5)
+        self.ax1.set_xlim(*self.rssi_limits[:2])
+        self.ax1.set_ylim(*self.rssi_limits[2:])
+        self.canvas.invalidate()
 
-        if rssi_updated:
-            print(f'current_frequencies={len(current_frequencies)}, {current_frequencies}')
-            print(f'current_rssi={len(current_rssi)}, {current_rssi}')
-            self.ax1.clear()
-            self.ax1.set_xlabel("Frequency (MHz)")
-            self.ax1.set_ylabel("RSSI (dBm)")
-            self.ax1.set_title("RSSI vs Frequency over Time")
-            self.ax1.grid(True)
-            for i, past_rssi in enumerate(self.history_rssi):
-                alpha = (i+1) * alpha_multiplier
-                
-                self.ax1.scatter(self.history_frequencies[i], past_rssi, marker='o', color='b', alpha=alpha)
-            self.ax1.scatter(current_frequencies, current_rssi, marker='o', color='k')
 
-        if uplink_updated:
-            print(f'current_uplink={current_uplink}')
-            self.ax2.clear()
-            self.ax2.set_ylim(-5, 105)
-            self.ax2.set_title("UpLink")
-            self.ax2.set_xticks([])
-            for i, past_uplink in enumerate(self.history_uplink):
-                alpha = i * alpha_multiplier + 0.2
-                self.ax2.scatter([0], [past_uplink], marker='o', color='g', alpha=alpha)
-            self.ax2.scatter([0], [current_uplink], marker='o', color='k')
+def _flatten(lists):
+    return [value for values in lists for value in values]
 
-        if downlink_updated:
-            print(f'current_downlink={current_downlink}')
-            self.ax3.clear()
-            self.ax3.set_ylim(-5, 105)
-            self.ax3.set_title("DownLink")
-            self.ax3.set_xticks([])
-            
-            for i, past_downlink in enumerate(self.history_uplink):
-                alpha = i * alpha_multiplier + 0.2
-                self.ax3.scatter([0], [past_downlink], marker='o', color='r', alpha=alpha)
-            self.ax3.scatter([0], [current_downlink], marker='o', color='k')
-        
-        plt.draw()
-        plt.pause(0.1)
\ No newline at end of file
+
+def _points(x, y):
+    return np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)]).reshape(-1, 2)
+
+
+def _colors(color, alphas):
+    colors = np.tile(matplotlib.colors.to_rgba(color), (len(alphas), 1))
+    colors[:, 3] = alphas
+    return colors
@@ -0,0 +1,118 @@
+import ast
+import json
+import re
+
+import numpy as np
+
+_FREQUENCY_PATTERN = re.compile(r"""['"]frequencyFrom['"]\s*:\s*(-?[\d.]+)""")
+_RSSI_PATTERN = re.compile(r"""['"]rssi['"]\s*:\s*(-?[\d.]+)""")
+
+
+def parse_signal_interference(signal_interference):
+    """
+    Parse one `signalInterference` cell into frequency and RSSI arrays.
+
+    Parameters:
+        signal_interference (str): The cell, a list of {'frequencyFrom': ..., 'rssi': ...} dicts as text.
+
+    Returns:
+        frequencies (np.ndarray): frequencyFrom of each entry.
+        rssi (np.ndarray): RSSI of each entry.
+    """
+    if not signal_interference:
+        return np.empty(0), np.empty(0)
+    frequencies = _FREQUENCY_PATTERN.findall(signal_interference)
+    rssi = _RSSI_PATTERN.findall(signal_interference)
+    if len(frequencies) != len(rssi) or len(frequencies) != signal_interference.count('{'):
+        # Entries the fast path can't pair up, fall back to a full parse (JSON as recorded, Python repr in old files)
+        try:
+            data_list = json.loads(signal_interference)
+        except ValueError:
+            data_list = ast.literal_eval(signal_interference)
+        frequencies = [item['frequencyFrom'] for item in data_list]
+        rssi = [item['rssi'] for item in data_list]
+    return np.array(frequencies, dtype=np.float64), np.array(rssi, dtype=np.float64)
+
+
+def build_rssi_matrix(signal_interferences):
+    """
+    Parse a column of `signalInterference` cells into a dense (rows x frequency bins) RSSI matrix.
+
+    Returns:
+        rssi (np.ndarray): float32 array of shape (rows, bins), NaN where a row has no entry for a bin.
+        frequencies (np.ndarray): Sorted frequencyFrom of each bin.
+    """
+    row_ids, all_frequencies, all_rssi = [], [], []
+    for row_id, signal_interference in enumerate(signal_interferences):
+        frequencies, rssi = parse_signal_interference(signal_interference)
+        row_ids.append(np.full(len(frequencies), row_id, dtype=np.int64))
+        all_frequencies.append(frequencies)
+        all_rssi.append(rssi)
+
+    rows = len(row_ids)
+    if rows == 0:
+        return np.empty((0, 0), dtype=np.float32), np.empty(0)
+    row_ids = np.concatenate(row_ids)
+    all_frequencies = np.concatenate(all_frequencies)
+    frequencies = np.unique(all_frequencies)
+
+    rssi_matrix = np.full((rows, len(frequencies)), np.nan, dtype=np.float32)
+    # fmax.at sees every entry, so a row listing a frequency twice keeps its strongest reading (NaN is ignored)
+    np.fmax.at(rssi_matrix, (row_ids, np.searchsorted(frequencies, all_frequencies)),
+               np.concatenate(all_rssi).astype(np.float32))
+    return rssi_matrix, frequencies
+
+
+def stack_rssi_matrices(blocks):
+    """
+    Stack RSSI matrices built for consecutive blocks of rows onto the union of their frequency bins.
+
+    Parameters:
+        blocks (list of (np.ndarray, np.ndarray)): (rssi, frequencies) pairs as returned by build_rssi_matrix.
+
+    Returns:
+        rssi (np.ndarray): float32 array of shape (total rows, bins).
+        frequencies (np.ndarray): Sorted frequencyFrom of each bin.
+    """
+    if not blocks:
+        return np.empty((0, 0), dtype=np.float32), np.empty(0)
+    frequencies = np.unique(np.concatenate([block_frequencies for _, block_frequencies in blocks]))
+    rssi_matrix = np.full((sum(len(block) for block, _ in blocks), len(frequencies)), np.nan, dtype=np.float32)
+    row = 0
+    for block, block_frequencies in blocks:
+        rssi_matrix[row:row + len(block), np.searchsorted(frequencies, block_frequencies)] = block
+        row += len(block)
+    return rssi_matrix, frequencies
+
+
+def reduce_rssi(rssi_matrix, frequencies, reduction='max', band=None):
+    """
+    Reduce an RSSI matrix to one value per row.
+
+    Parameters:
+        rssi_matrix (np.ndarray): Array of shape (rows, bins), NaN for missing entries.
+        frequencies (np.ndarray): frequencyFrom of each bin.
+        reduction (str): 'max' or 'mean' over the selected bins.
+        band (Sequence[float] or None): Optional [low, high] frequencyFrom range (inclusive) to reduce over.
+
+    Returns:
+        info (np.ndarray): float64 array of shape (rows,), NaN for rows without any entry in the band.
+    """
+    rssi_matrix = np.asarray(rssi_matrix, dtype=np.float64)
+    if band is not None:
+        rssi_matrix = rssi_matrix[:, (band[0] <= frequencies) & (frequencies <= band[1])]
+    if rssi_matrix.shape[1] == 0:
+        return np.full(rssi_matrix.shape[0], np.nan)
+
+    if reduction == 'max':
+        return np.fmax.reduce(rssi_matrix, axis=1)  # fmax ignores NaN, all-NaN rows stay NaN
+    if reduction == 'mean':
+        valid = ~np.isnan(rssi_matrix)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(valid, rssi_matrix, 0).sum(axis=1) / valid.sum(axis=1)
+    raise ValueError(f"Unknown rssi reduction: {reduction}")
+
+
+def rssi_info(config, rssi_matrix, frequencies):
+    """Reduce an RSSI matrix according to the config's optional `rssi_reduction` and `rssi_band` keys."""
+    return reduce_rssi(rssi_matrix, frequencies, config.get('rssi_reduction', 'max'), config.get('rssi_band'))
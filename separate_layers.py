@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 def group_heights_by_count(heights, count_threshold=30):
     """
@@ -11,44 +10,85 @@ def group_heights_by_count(heights, count_threshold=30):
 
     Returns:
     - group_bounds (list of tuples): List of (min_height, max_height) bounds for each group.
-    - groups (list of lists): List of groups of indices for the original heights.
+    - groups (list of np.ndarray): List of groups of indices for the original heights.
     """
-    # Get unique heights and their counts
-    heights_rounded = np.round(heights)  # Round heights to the nearest integer
-    unique_heights, counts = np.unique(heights_rounded, return_counts=True)
+    heights = np.asarray(heights, dtype=np.float64)
+    # Count the heights rounded to the nearest integer
+    heights_rounded = np.round(heights[np.isfinite(heights)]).astype(np.int64)
+    if heights_rounded.size == 0:
+        return [], []
+    lowest_height = heights_rounded.min()
+    counts = np.bincount(heights_rounded - lowest_height)
 
     # Filter heights with counts above the threshold
-    valid_heights = unique_heights[counts >= count_threshold]
-
-    # Identify consecutive sequences of valid heights
-    groups = []
-    group_bounds = []
-    current_group = []
-
-    for i, height in enumerate(valid_heights):
-        if i > 0 and height != valid_heights[i - 1] + 1:
-            # End of a sequence
-            if current_group:
-                group_bounds.append((current_group[0], current_group[-1]))
-                groups.append(current_group)
-            current_group = []
-        current_group.append(height)
-
-    # Handle the last group
-    if current_group:
-        group_bounds.append((current_group[0], current_group[-1]))
-        groups.append(current_group)
-
-    # Create the final list of indices for each group
-    index_groups = []
-    for bounds in group_bounds:
-        min_height, max_height = bounds
-        indices = [i for i, h in enumerate(heights) if min_height - 1 <= h <= max_height + 1]
-        index_groups.append(indices)
+    valid_heights = (np.flatnonzero(counts >= count_threshold) + lowest_height).astype(np.float64)
+
+    # Identify consecutive sequences of valid heights: a new run starts wherever the step is not 1
+    run_starts = np.flatnonzero(np.diff(valid_heights) != 1) + 1
+    first = np.concatenate(([0], run_starts))
+    last = np.concatenate((run_starts, [len(valid_heights)])) - 1
+    group_bounds = list(zip(valid_heights[first], valid_heights[last])) if len(valid_heights) else []
+
+    # Create the final list of indices for each group from one label per point
+    labels, overlap_labels = assign_height_layers(heights, group_bounds)
+    order = np.argsort(labels, kind='stable')
+    group_sizes = np.bincount(labels + 1, minlength=len(group_bounds) + 1)
+    index_groups = np.split(order, np.cumsum(group_sizes)[:-1])[1:]  # Drop the ungrouped points (label -1)
+
+    # Points on a shared boundary belong to the group above too
+    overlapping = np.flatnonzero(overlap_labels >= 0)
+    for group in np.unique(overlap_labels[overlapping]):
+        index_groups[group] = np.union1d(index_groups[group], overlapping[overlap_labels[overlapping] == group])
 
     return group_bounds, index_groups
 
 
+def assign_height_layers(heights, group_bounds):
+    """
+    Label every height with the group whose bounds, widened by 1 on each side, contain it.
+
+    Groups are separated by at least one height, so widened groups can only share their boundary: a height exactly
+    equal to max_height + 1 of a group and min_height - 1 of the next one. Such a height is labelled with the lower
+    group and its upper group is given in overlap_labels.
+
+    Parameters:
+    - heights (list or np.ndarray): Array of height values.
+    - group_bounds (list of tuples): Sorted (min_height, max_height) integer bounds, as from group_heights_by_count.
+
+    Returns:
+    - labels (np.ndarray): Group index of each height, -1 for heights outside every group.
+    - overlap_labels (np.ndarray): Upper group index of heights on a shared boundary, -1 elsewhere.
+    """
+    heights = np.asarray(heights, dtype=np.float64)
+    labels = np.full(len(heights), -1, dtype=np.int64)
+    overlap_labels = np.full(len(heights), -1, dtype=np.int64)
+    if not group_bounds:
+        return labels, overlap_labels
+
+    bounds = np.asarray(group_bounds, dtype=np.int64)
+    window_low, window_high = bounds[:, 0] - 1, bounds[:, 1] + 1
+    base = window_low[0]
+    table_size = window_high[-1] - base + 1
+
+    # Lookup tables from floor(height) to group: [low, high) windows are disjoint, the closed upper ends are separate
+    group_of_floor = np.full(table_size, -1, dtype=np.int64)
+    for group, (low, high) in enumerate(zip(window_low - base, window_high - base)):
+        group_of_floor[low:high] = group
+    group_ending_at = np.full(table_size, -1, dtype=np.int64)
+    group_ending_at[window_high - base] = np.arange(len(bounds))
+
+    floors = np.floor(heights)
+    in_table = (floors >= base) & (floors < base + table_size)  # False for NaN
+    offsets = (floors[in_table] - base).astype(np.int64)
+    labels[in_table] = group_of_floor[offsets]
+
+    # Integer heights on the upper end of a window belong to that (lower) group as well
+    ending = np.full(len(heights), -1, dtype=np.int64)
+    ending[in_table] = np.where(heights[in_table] == floors[in_table], group_ending_at[offsets], -1)
+    shared = (ending >= 0) & (labels >= 0)
+    overlap_labels[shared] = labels[shared]
+    labels = np.where(ending >= 0, ending, labels)
+    return labels, overlap_labels
 
 
 def draw_groups_in_3d(positions, index_groups):
@@ -64,6 +104,8 @@ def draw_groups_in_3d(positions, index_groups):
     Returns:
     - None. Displays the 3D plot.
     """
+    import matplotlib.pyplot as plt
+
     print(f'positions={positions}')
     print(f'index_groups={index_groups}')
     # Ensure positions is a numpy array
@@ -74,8 +116,10 @@ def draw_groups_in_3d(positions, index_groups):
     group_colors = [cmap(i) for i in range(len(index_groups))]
 
     # Identify indices that are not in any group
-    all_grouped_indices = set(idx for group in index_groups for idx in group)
-    ungrouped_indices = [i for i in range(len(positions[2])) if i not in all_grouped_indices]
+    ungrouped = np.ones(positions.shape[1], dtype=bool)
+    if len(index_groups):
+        ungrouped[np.concatenate(index_groups).astype(np.int64)] = False
+    ungrouped_indices = np.flatnonzero(ungrouped)
 
     # Create a 3D plot
     fig = plt.figure(figsize=(10, 8))
@@ -88,7 +132,7 @@ def draw_groups_in_3d(positions, index_groups):
                    color=group_colors[i], label=f"Group {i + 1}", s=50)
 
     # Plot ungrouped points in gray
-    if ungrouped_indices:
+    if ungrouped_indices.size:
         ungrouped_positions = positions[:, ungrouped_indices]
         ax.scatter(ungrouped_positions[0, :], ungrouped_positions[1, :], ungrouped_positions[2, :],
                    color='gray', label="Ungrouped", s=30, alpha=0.6)
@@ -1,27 +1,29 @@
 import ast
 import csv
+import sys
 import time
 
 import numpy as np
-import yaml
 
-import matplotlib.pyplot as plt
-from matplotlib import cm
-import matplotlib.colors as mcolors
-
-from ransac_3d import custom_ransac
+from ransac_3d import plot_ransac_line
 from find_shabash_2d_bins import find_shabash_2d_bins
 from plot_shabash_ransac import plot_3d_data
 
+from analysis_config import DEFAULT_CONFIG_PATH, load_config
 from read_csv import load_data_for_graph
-from separate_layers import group_heights_by_count, draw_groups_in_3d
-from subtract_histograms import  subtraction_histograms_avg_loc, average_loc_of_points_per_bin, average_loc_and_corresponding_dif
+from source_localization import bootstrap_source_location, localize_source
+from stage_profiler import StageProfiler
+from separate_layers import draw_groups_in_3d
 from multi_dim_histogram import multi_dim_histogram
 from display_histogram import display_histogram
 
 
 class LocationGraph:
     def __init__(self, config, is_diff_graph=False, diff_graph_label=None):
+        import matplotlib.pyplot as plt
+        from matplotlib import cm
+        import matplotlib.colors as mcolors
+
         self.fig = plt.figure(figsize=(10, 10))
         self.ax = self.fig.add_subplot(1, 1, 1, projection='3d')
         self.axis_labels = ["lon", "lat", "asl"]
@@ -59,12 +61,14 @@ class LocationGraph:
 
 def plot_diffrence_histogram(info_histogram, plot_edges):
     """Plot the final graph based on all loaded data."""
+    import matplotlib.pyplot as plt
+    from matplotlib import cm
+    import matplotlib.colors as mcolors
+
     ax = plt.figure().add_subplot(projection='3d')
     axis_labels = ["lon", "lat", "asl"]
     cmap = cm.get_cmap('RdYlGn')
-    with open('csv_lines_config.yaml', 'r') as file:
-        data = yaml.safe_load(file)
-        config = data[data['config']]
+    config = load_config()
     show_shabash = config['show_shabash']
     shabash_loc = config['shabash_loc']
     bar_range = [-50, 50]
@@ -76,42 +80,31 @@ def plot_diffrence_histogram(info_histogram, plot_edges):
     plt.pause(0.1)  # Ensure the figure is drawn
     plt.show(block=False)  # Show the graph in a non-blocking way
 
-def run():
-    with open('csv_lines_config.yaml', 'r') as file:
-        data = yaml.safe_load(file)
-        config = data[data['config']]
-
-    two_graphs_labels = []
-    two_history_locations = []
-    two_history_infos = []
-    for graph_config in config['graphs']:
-        # location_graph = LocationGraph(config)  # Create a new graph object for each graph
-        history_location, history_info = load_data_for_graph(config, graph_config)
-        two_history_locations.append(history_location)
-        two_history_infos.append(history_info)
-        # _, height_groupings = group_heights_by_count(history_location[2])
-        #
-        #
-        #
-        # draw_groups_in_3d(history_location, height_groupings)
-
-        # for grouping in height_groupings:
-        #     # print(f'grouping={grouping}')
-        #     locs_in_grouping = history_location[:, grouping]
-        #     infos_in_grouping = history_info[grouping]
-        #     # find_shabash_2d(locs_in_grouping[0], locs_in_grouping[1], infos_in_grouping)
-        #     find_shabash_2d_bins(locs_in_grouping[0], locs_in_grouping[1], infos_in_grouping)
-
-    # diff_hist, common_edges = subtraction_histograms(two_history_locations[0], two_history_infos[0],
-    #                                                  two_history_locations[1], two_history_infos[1],
-    #                                                  config['histogram_bins_difference_graph'])
-    avg_value_hist1, avg_value_hist2, diff_hist, common_edges = subtraction_histograms_avg_loc(two_history_locations[0], two_history_infos[0],
-                                                     two_history_locations[1], two_history_infos[1],
-                                                     config['histogram_bins_difference_graph'])
-    average_locations1, average_locations2 = average_loc_of_points_per_bin(two_history_locations[0], two_history_locations[1], common_edges)
-    final_locations, final_values = average_loc_and_corresponding_dif(average_locations1, average_locations2, avg_value_hist1, avg_value_hist2)
-    # print(f'final_locations={average_locations1}')
-    # print(f'final_values={final_values}')
+def print_bootstrap_confidence_region(config):
+    """Resample the points of both graphs to estimate the uncertainty of the source location."""
+    (sample1, values1), (sample2, values2) = [load_data_for_graph(config, graph_config)
+                                              for graph_config in config['graphs'][:2]]
+    result = bootstrap_source_location(sample1, values1, sample2, values2, config['histogram_bins_difference_graph'],
+                                       n_replicates=config['bootstrap_replicates'],
+                                       confidence=config.get('bootstrap_confidence', 0.95),
+                                       ground_asl=config.get('ground_asl', 77),
+                                       count_threshold=config.get('layer_count_threshold', 30),
+                                       sparse=config.get('sparse_histograms', False),
+                                       workers=config.get('load_workers'))
+    print(f"Bootstrap: {len(result.estimates)} estimates out of {result.n_replicates} replicates")
+    print(f"Bootstrap source location: {result.center}")
+    print(f"{result.confidence:.0%} confidence ellipsoid radii: {result.radii} along axes (columns):\n{result.axes}")
+    return result
+
+def run(config_path=DEFAULT_CONFIG_PATH, section=None):
+    import matplotlib.pyplot as plt
+
+    config = load_config(config_path, section)
+    # Opt-in: record the time and memory of every stage and write them to config['profile_report']
+    profiler = StageProfiler(enabled=bool(config.get('profile_report')))
+
+    result = localize_source(config, profiler)
+    final_locations, final_values = result['final_locations'], result['final_values']
     # Analyze final_values
     num_above_zero = np.sum(final_values > 0)  # Count values above 0
     num_below_zero = np.sum(final_values < 0)  # Count values below 0
@@ -122,22 +115,35 @@ def run():
     print(f"Average of final_values: {average_value:.2f}")
     final_locations_trans = final_locations.T
     # plot_3d_locations_with_values(final_locations, final_values)
-    _, height_groupings = group_heights_by_count(final_locations_trans[2])
-    draw_groups_in_3d(final_locations_trans, height_groupings)
-    shabash_loc_2d_and_zs = []
-    for grouping in height_groupings:
+    draw_groups_in_3d(final_locations_trans, result['layer_groups'])
+    for grouping, layer_estimate in zip(result['layer_groups'], result['layer_estimates']):
+        if layer_estimate is None:
+            continue  # No high enough difference in this layer, nothing to plot
         locs_in_grouping = final_locations_trans[:, grouping]
-        # print(f'locs_in_grouping+{locs_in_grouping}')
-        grouping_z = np.mean(locs_in_grouping[2])
-        infos_in_grouping = final_values[grouping]
-        # find_shabash_2d(locs_in_grouping[0], locs_in_grouping[1], infos_in_grouping)
-        shabash_loc_2d = find_shabash_2d_bins(locs_in_grouping[0], locs_in_grouping[1], infos_in_grouping, plot=True)
-
-        shabash_loc_2d_and_zs.append((shabash_loc_2d[0], shabash_loc_2d[1], grouping_z))
-
-    # shabash_loc_3d, ransac_coef, ransac_intercept = ransac_find_shabash(shabash_loc_2d_and_zs, ground_asl=77)
-    shabash_loc_3d, ransac_line_point, ransac_direction_vector = custom_ransac(shabash_loc_2d_and_zs, ground_asl=77)
-    plot_3d_data(final_locations, shabash_loc_2d_and_zs, shabash_loc_3d, ransac_line_point, ransac_direction_vector)
+        find_shabash_2d_bins(locs_in_grouping[0], locs_in_grouping[1], final_values[grouping], plot=True)
+
+    shabash_loc_3d = result['shabash_loc_3d']
+    if shabash_loc_3d is None:
+        print("Fewer than two layers have a source estimate, cannot fit the RANSAC line")
+    else:
+        shabash_loc_2d_and_zs = [estimate for estimate in result['layer_estimates'] if estimate is not None]
+        ransac_line_point, ransac_direction_vector = result['ransac_line_point'], result['ransac_direction_vector']
+        print(f"Point on Line: {ransac_line_point}")
+        print(f"Direction Vector: {ransac_direction_vector}")
+        print(f"Intersection with z=ground_asl at: x={shabash_loc_3d[0]}, y={shabash_loc_3d[1]}, z={shabash_loc_3d[2]}")
+        plot_ransac_line(shabash_loc_2d_and_zs, result['ransac_inlier_mask'], ransac_line_point,
+                         ransac_direction_vector, shabash_loc_3d[:2], shabash_loc_3d[2])
+        plot_3d_data(final_locations, shabash_loc_2d_and_zs, shabash_loc_3d, ransac_line_point,
+                     ransac_direction_vector, config['real_shabash_loc'])
+
+    if config.get('bootstrap_replicates'):
+        with profiler.stage('bootstrap', replicates=config['bootstrap_replicates']) as record:
+            bootstrap = print_bootstrap_confidence_region(config)
+            record['outputs'] = dict(estimates=bootstrap.estimates)
+
+    if profiler.enabled:
+        profiler.write_json(config['profile_report'])
+        profiler.print_summary()
 
     # plot_diffrence_histogram(diff_hist, common_edges)
     # diff_points, diff_values = points_from_histogram(diff_hist, common_edges)
@@ -146,5 +152,7 @@ def run():
     # _, height_groupings = group_heights_by_count(diff_points[:, 2])
     # draw_groups_in_3d(diff_points.T, height_groupings)
     plt.show()  # Keep all graph windows open
+    return result
 
-run()
+if __name__ == '__main__':  # Guard so process-pool workers can import this module
+    run(*sys.argv[1:3])  # Optional config path and section
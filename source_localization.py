@@ -0,0 +1,243 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from find_shabash_2d_bins import find_shabash_2d_bins
+from ransac_3d import ground_intersection, ransac_line_3d
+from read_csv import load_data_for_graph
+from separate_layers import group_heights_by_count
+from stage_profiler import StageProfiler
+from streaming_histograms import streamed_subtraction_histograms_avg_loc
+from subtract_histograms import subtraction_histograms_avg_loc, average_loc_of_points_per_bin, \
+    average_loc_and_corresponding_dif
+
+BOOTSTRAP_BATCH = 8  # Replicates per pool task
+NO_PROFILER = StageProfiler(enabled=False)
+
+
+def subtraction_histograms_for_config(config, profiler=NO_PROFILER):
+    """
+    Compute the average value and location histograms of the first two graphs of a config on a common grid.
+
+    The points are loaded at once, or streamed through mergeable partial histograms when config['stream_chunk_rows']
+    is set. Each stage is recorded by `profiler`.
+
+    Returns:
+        The 6 values returned by streamed_subtraction_histograms_avg_loc.
+    """
+    bins = config['histogram_bins_difference_graph']
+    if config.get('stream_chunk_rows'):
+        with profiler.stage('streamed histograms', chunk_rows=config['stream_chunk_rows'], bins=bins) as record:
+            histograms = streamed_subtraction_histograms_avg_loc(config, config['graphs'][0], config['graphs'][1],
+                                                                 bins, config['stream_chunk_rows'],
+                                                                 config.get('load_workers'))
+            record['outputs'] = dict(avg_value_hist1=histograms[0], average_locations1=histograms[4])
+        return histograms
+
+    samples = []
+    for graph_config in config['graphs'][:2]:
+        with profiler.stage(f"load {graph_config['title']}", files=len(graph_config['files'])) as record:
+            history_location, history_info = load_data_for_graph(config, graph_config)
+            record['outputs'] = dict(history_location=history_location, history_info=history_info)
+        samples.append((history_location, history_info))
+    (sample1, values1), (sample2, values2) = samples
+
+    sparse = config.get('sparse_histograms', False)  # Only keep the occupied bins of fine grids
+    with profiler.stage('subtraction histograms', sample1=sample1, sample2=sample2, bins=bins,
+                        sparse=sparse) as record:
+        avg_value_hist1, avg_value_hist2, diff_hist, common_edges = subtraction_histograms_avg_loc(
+            sample1, values1, sample2, values2, bins, sparse=sparse)
+        record['outputs'] = dict(avg_value_hist1=avg_value_hist1, avg_value_hist2=avg_value_hist2, diff_hist=diff_hist)
+    with profiler.stage('average locations per bin', sample1=sample1, sample2=sample2) as record:
+        average_locations1, average_locations2 = average_loc_of_points_per_bin(sample1, sample2, common_edges,
+                                                                               sparse=sparse)
+        record['outputs'] = dict(average_locations1=average_locations1, average_locations2=average_locations2)
+    return avg_value_hist1, avg_value_hist2, diff_hist, common_edges, average_locations1, average_locations2
+
+
+def localize_source(config, profiler=NO_PROFILER):
+    """
+    Run the whole source-localization pipeline of a config section without any plotting.
+
+    Returns:
+        result (dict): As returned by localize_from_histograms.
+    """
+    avg_value_hist1, avg_value_hist2, _, _, average_locations1, average_locations2 = \
+        subtraction_histograms_for_config(config, profiler)
+    return localize_from_histograms(average_locations1, average_locations2, avg_value_hist1, avg_value_hist2,
+                                    ground_asl=config.get('ground_asl', 77),
+                                    count_threshold=config.get('layer_count_threshold', 30), profiler=profiler)
+
+
+def localize_from_histograms(average_locations1, average_locations2, avg_value_hist1, avg_value_hist2, ground_asl=77,
+                             count_threshold=30, profiler=NO_PROFILER):
+    """
+    Pair the bins of both histograms, group them into height layers, estimate the source of each layer in 2D and fit
+    a RANSAC line through the layer estimates down to the ground.
+
+    Parameters:
+        average_locations1, average_locations2, avg_value_hist1, avg_value_hist2: Dense or sparse grids, as for
+            average_loc_and_corresponding_dif.
+        ground_asl (float): Height of the ground plane the source is on.
+        count_threshold (int): Minimum count of a height for it to be part of a layer.
+        profiler (StageProfiler): Records each stage, disabled by default.
+
+    Returns:
+        result (dict) with:
+            final_locations (ndarray): Array of shape (M, 3), location of each bin both histograms have.
+            final_values (ndarray): Array of shape (M,), value difference in each of these bins.
+            layer_bounds (list of tuples): (min_height, max_height) of each layer.
+            layer_groups (list of ndarray): Indices into final_locations of the bins of each layer.
+            layer_estimates (list of tuples or None): (x, y, z) source estimate of each layer, None if it has none.
+            shabash_loc_3d (tuple or None): (x, y, ground_asl) estimate of the source, None if fewer than two layers
+                have an estimate.
+            ransac_line_point, ransac_direction_vector (ndarray or None): The RANSAC line.
+            ransac_inlier_mask (ndarray or None): Which of the layer estimates (that are not None) are inliers.
+    """
+    with profiler.stage('pair bins', avg_value_hist1=avg_value_hist1, avg_value_hist2=avg_value_hist2) as record:
+        final_locations, final_values = average_loc_and_corresponding_dif(average_locations1, average_locations2,
+                                                                          avg_value_hist1, avg_value_hist2)
+        record['outputs'] = dict(final_locations=final_locations, final_values=final_values)
+    final_locations_trans = final_locations.T
+    with profiler.stage('layer grouping', heights=final_locations_trans[2]) as record:
+        layer_bounds, layer_groups = group_heights_by_count(final_locations_trans[2], count_threshold)
+        record['outputs'] = dict(layers=len(layer_groups))
+
+    with profiler.stage('layer 2D estimates', layers=len(layer_groups)) as record:
+        layer_estimates = []
+        for grouping in layer_groups:
+            locs_in_grouping = final_locations_trans[:, grouping]
+            shabash_loc_2d = find_shabash_2d_bins(locs_in_grouping[0], locs_in_grouping[1], final_values[grouping])
+            # No estimate for layers without a high enough difference
+            layer_estimates.append(None if shabash_loc_2d is None else
+                                   (shabash_loc_2d[0], shabash_loc_2d[1], np.mean(locs_in_grouping[2])))
+        record['outputs'] = dict(estimates=sum(estimate is not None for estimate in layer_estimates))
+
+    result = dict(final_locations=final_locations, final_values=final_values, layer_bounds=layer_bounds,
+                  layer_groups=layer_groups, layer_estimates=layer_estimates, shabash_loc_3d=None,
+                  ransac_line_point=None, ransac_direction_vector=None, ransac_inlier_mask=None)
+    shabash_loc_2d_and_zs = [estimate for estimate in layer_estimates if estimate is not None]
+    if len(shabash_loc_2d_and_zs) < 2:
+        return result
+    with profiler.stage('RANSAC', points=len(shabash_loc_2d_and_zs)) as record:
+        line_point, direction_vector, inlier_mask = ransac_line_3d(np.array(shabash_loc_2d_and_zs))
+        intersection_x, intersection_y = ground_intersection(line_point, direction_vector, ground_asl)
+        record['outputs'] = dict(inliers=int(inlier_mask.sum()))
+    result.update(shabash_loc_3d=(intersection_x, intersection_y, ground_asl), ransac_line_point=line_point,
+                  ransac_direction_vector=direction_vector, ransac_inlier_mask=inlier_mask)
+    return result
+
+
+def estimate_source(sample1, values1, sample2, values2, bins, ground_asl=77, count_threshold=30, sparse=False):
+    """
+    Run the histogram difference -> layer grouping -> per-layer 2D source -> RANSAC chain on two sets of points.
+
+    Parameters:
+        sample1 (ndarray): Array of shape (3, N1), lon, lat and asl of the first set of points.
+        values1 (ndarray): Array of shape (N1,), info of the first set of points.
+        sample2 (ndarray): Array of shape (3, N2), lon, lat and asl of the second set of points.
+        values2 (ndarray): Array of shape (N2,), info of the second set of points.
+        bins (Sequence[int]): Number of bins of the difference histogram in each dimension.
+        ground_asl (float): Height of the ground plane the source is on.
+        count_threshold (int): Minimum count of a height for it to be part of a layer.
+        sparse (bool): Use sparse histograms, see subtraction_histograms_avg_loc.
+
+    Returns:
+        result (dict): As returned by localize_from_histograms.
+    """
+    avg_value_hist1, avg_value_hist2, _, common_edges = subtraction_histograms_avg_loc(sample1, values1, sample2,
+                                                                                       values2, bins, sparse=sparse)
+    average_locations1, average_locations2 = average_loc_of_points_per_bin(sample1, sample2, common_edges,
+                                                                           sparse=sparse)
+    return localize_from_histograms(average_locations1, average_locations2, avg_value_hist1, avg_value_hist2,
+                                    ground_asl, count_threshold)
+
+
+class BootstrapResult:
+    """
+    Bootstrap distribution of the source estimate and its confidence ellipsoid.
+
+    The ellipsoid is centred on the mean of the estimates with the shape of their covariance, scaled so that the
+    requested fraction of the estimates lie inside it (their empirical Mahalanobis distance quantile).
+    """
+
+    def __init__(self, estimates, n_replicates, confidence):
+        self.estimates = estimates  # Shape (K, 3), one row per replicate that gave an estimate
+        self.n_replicates = n_replicates
+        self.confidence = confidence
+        self.center = np.mean(estimates, axis=0)
+        self.covariance = np.atleast_2d(np.cov(estimates, rowvar=False)) if len(estimates) > 1 \
+            else np.zeros((3, 3))
+        # z is pinned to ground_asl, so the covariance is singular and the pseudo-inverse is used
+        self._precision = np.linalg.pinv(self.covariance)
+        self.scale = np.sqrt(np.quantile(self.mahalanobis_squared(estimates), confidence)) if len(estimates) \
+            else np.nan
+        variances, self.axes = np.linalg.eigh(self.covariance)
+        self.radii = self.scale * np.sqrt(np.clip(variances, 0, None))  # Semi-axis length along each column of axes
+
+    @property
+    def failures(self):
+        """Number of replicates for which the chain gave no estimate."""
+        return self.n_replicates - len(self.estimates)
+
+    def mahalanobis_squared(self, points):
+        offsets = np.atleast_2d(points) - self.center
+        return np.einsum('nd,de,ne->n', offsets, self._precision, offsets)
+
+    def contains(self, point):
+        """Whether a point lies inside the confidence ellipsoid."""
+        return bool(self.mahalanobis_squared(point)[0] <= self.scale ** 2)
+
+
+def bootstrap_source_location(sample1, values1, sample2, values2, bins, n_replicates=200, confidence=0.95,
+                              ground_asl=77, count_threshold=30, sparse=False, workers=None, random_state=0):
+    """
+    Estimate the uncertainty of the source location by resampling the telemetry points of both sets with
+    replacement and rerunning estimate_source on every replicate.
+
+    Replicates are run in batches over a process pool. The points are sent once to each worker, and every replicate
+    draws its resampling indices in a single vectorized call from its own independent seed, so the result does not
+    depend on the number of workers.
+
+    Returns:
+        result (BootstrapResult): The estimates of the replicates and their confidence ellipsoid.
+    """
+    seeds = np.random.SeedSequence(random_state).spawn(n_replicates)
+    batches = [seeds[start:start + BOOTSTRAP_BATCH] for start in range(0, n_replicates, BOOTSTRAP_BATCH)]
+    options = dict(bins=bins, ground_asl=ground_asl, count_threshold=count_threshold, sparse=sparse)
+    workers = min(len(batches), workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_bootstrap_worker,
+                                 initargs=(sample1, values1, sample2, values2, options)) as executor:
+            results = list(executor.map(_bootstrap_batch, batches))
+    else:
+        _init_bootstrap_worker(sample1, values1, sample2, values2, options)
+        results = [_bootstrap_batch(batch) for batch in batches]
+
+    estimates = [estimate for batch in results for estimate in batch if estimate is not None]
+    return BootstrapResult(np.array(estimates, dtype=np.float64).reshape(-1, 3), n_replicates, confidence)
+
+
+_bootstrap_data = None
+
+
+def _init_bootstrap_worker(sample1, values1, sample2, values2, options):
+    global _bootstrap_data
+    _bootstrap_data = (np.asarray(sample1), np.asarray(values1), np.asarray(sample2), np.asarray(values2), options)
+
+
+def _bootstrap_batch(seeds):
+    sample1, values1, sample2, values2, options = _bootstrap_data
+    estimates = []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        indices1 = rng.integers(len(values1), size=len(values1))
+        indices2 = rng.integers(len(values2), size=len(values2))
+        try:
+            shabash_loc_3d = estimate_source(sample1[:, indices1], values1[indices1],
+                                             sample2[:, indices2], values2[indices2], **options)['shabash_loc_3d']
+        except ValueError:  # Degenerate replicate, e.g. all layer estimates at one point
+            shabash_loc_3d = None
+        estimates.append(shabash_loc_3d)
+    return estimates
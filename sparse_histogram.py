@@ -0,0 +1,78 @@
+import numpy as np
+
+from histogram_engine import flat_bin_index
+
+
+class SparseGrid:
+    """
+    Values of the occupied bins of a grid only, keyed by their flat (C-order) bin index.
+
+    Memory scales with the number of occupied bins rather than with the grid volume, which matters for
+    fine-resolution grids where a flight only covers a thin shell of the (lon, lat, asl) box.
+    """
+
+    def __init__(self, edges, keys, values):
+        self.edges = edges
+        self.keys = keys  # Sorted, unique
+        self.values = values  # Shape (K,) or (K, D)
+
+    @property
+    def shape(self):
+        return tuple(len(dim_edges) - 1 for dim_edges in self.edges)
+
+    def centers(self):
+        """Return the (K, D) centres of the occupied bins."""
+        multi_index = np.unravel_index(self.keys, self.shape)
+        return np.stack([0.5 * (dim_edges[index] + dim_edges[index + 1])
+                         for dim_edges, index in zip(self.edges, multi_index)], axis=-1)
+
+    def to_dense(self):
+        """Return the equivalent dense grid, NaN in the bins that are not stored."""
+        dense = np.full((int(np.prod(self.shape)),) + self.values.shape[1:], np.nan)
+        dense[self.keys] = self.values
+        return dense.reshape(self.shape + self.values.shape[1:])
+
+    def subtract(self, other):
+        """Subtract another grid over the same edges, keeping only the bins where both have non-NaN values."""
+        keys, mine, theirs = np.intersect1d(self.keys, other.keys, assume_unique=True, return_indices=True)
+        diff = self.values[mine] - other.values[theirs]
+        valid = ~np.isnan(diff) if diff.ndim == 1 else ~np.isnan(diff).any(axis=-1)
+        return SparseGrid(self.edges, keys[valid], diff[valid])
+
+
+class SparseHistogram:
+    """Per-bin sum and count of values, and optionally sum of locations, over the occupied bins of a grid only."""
+
+    def __init__(self, edges, keys, hist_sum, hist_count, location_sum=None):
+        self.edges = edges
+        self.keys = keys
+        self.hist_sum = hist_sum
+        self.hist_count = hist_count
+        self.location_sum = location_sum
+
+    @classmethod
+    def from_points(cls, sample, values, edges, track_locations=False):
+        """Bin every point of `sample` (shape (D, N)) once and reduce its values per occupied bin."""
+        sample = np.asarray(sample, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        flat_index = flat_bin_index(sample, edges)
+        inside = flat_index >= 0
+        keys, group = np.unique(flat_index[inside], return_inverse=True)
+
+        hist_sum = np.bincount(group, weights=values[inside], minlength=len(keys))
+        hist_count = np.bincount(group, minlength=len(keys)).astype(np.float64)
+        location_sum = None
+        if track_locations:
+            location_sum = np.stack([np.bincount(group, weights=dim[inside], minlength=len(keys)) for dim in sample],
+                                    axis=-1)
+        return cls(edges, keys, hist_sum, hist_count, location_sum)
+
+    def average(self):
+        """Return the average value of each occupied bin as a SparseGrid."""
+        return SparseGrid(self.edges, self.keys, self.hist_sum / self.hist_count)
+
+    def average_locations(self):
+        """Return the average location of the points of each occupied bin as a SparseGrid of (K, D) values."""
+        if self.location_sum is None:
+            raise ValueError("Locations are not tracked, create the histogram with track_locations=True")
+        return SparseGrid(self.edges, self.keys, self.location_sum / self.hist_count[:, np.newaxis])
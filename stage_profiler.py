@@ -0,0 +1,126 @@
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+from sparse_histogram import SparseGrid
+
+DESCRIBE_MAX_ITEMS = 16  # Longer lists and tuples are described by their length only
+
+
+class StageProfiler:
+    """
+    Opt-in per-stage wall time, CPU time, peak memory and input/output sizes of a pipeline run.
+
+    Stages are timed with `with profiler.stage(name, **inputs) as record:`, setting record['outputs'] to describe
+    what the stage produced. Stages can be nested. A disabled profiler measures nothing, so call sites don't need to
+    check whether profiling is on.
+
+    CPU time is the time of this process only, work done in process-pool workers shows up as wall time. Peak memory
+    is the highest traced allocation above the memory in use when the stage started, as seen by tracemalloc (NumPy
+    buffers included, memory-mapped files not). Tracing allocations slows down pure-Python code, so compare the
+    timings of profiled runs with each other rather than with unprofiled ones.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = []
+        self._open = []
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name, **inputs):
+        record = {'name': name, 'inputs': {key: describe(value) for key, value in inputs.items()} if self.enabled
+                  else {}, 'outputs': {}}
+        if not self.enabled:
+            yield record
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        for parent in self._open:  # Keep the parents' peak before resetting it for this stage
+            parent['_peak'] = max(parent['_peak'], peak)
+        tracemalloc.reset_peak()
+        record.update(depth=len(self._open), _start_memory=current, _peak=current)
+        self.stages.append(record)
+        self._open.append(record)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            _, peak = tracemalloc.get_traced_memory()
+            record['_peak'] = max(record['_peak'], peak)
+            record['peak_memory_bytes'] = record['_peak'] - record.pop('_start_memory')
+            self._open.pop()
+            for parent in self._open:
+                parent['_peak'] = max(parent['_peak'], record['_peak'])
+            record['outputs'] = {key: describe(value) for key, value in record['outputs'].items()}
+            if not self._open and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def report(self):
+        """Return the recorded stages as a JSON-serializable dict."""
+        stages = [{key: value for key, value in record.items() if not key.startswith('_')} for record in self.stages]
+        top_level = [record for record in stages if record['depth'] == 0]
+        return {
+            'stages': stages,
+            'total_wall_s': sum(record['wall_s'] for record in top_level),
+            'total_cpu_s': sum(record['cpu_s'] for record in top_level),
+            'peak_memory_bytes': max((record['peak_memory_bytes'] for record in top_level), default=0),
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+    def print_summary(self, file=sys.stdout):
+        """Print one line per stage: wall time, CPU time, peak memory and the size of the outputs."""
+        if not self.enabled:
+            return
+        report = self.report()
+        print(f"{'stage':<36} {'wall':>9} {'cpu':>9} {'peak mem':>10}  outputs", file=file)
+        for record in report['stages']:
+            name = '  ' * record['depth'] + record['name']
+            outputs = ', '.join(f'{key}={_short(value)}' for key, value in record['outputs'].items())
+            print(f"{name:<36} {record['wall_s']:8.3f}s {record['cpu_s']:8.3f}s "
+                  f"{record['peak_memory_bytes'] / 2 ** 20:7.1f}MiB  {outputs}", file=file)
+        print(f"{'total':<36} {report['total_wall_s']:8.3f}s {report['total_cpu_s']:8.3f}s "
+              f"{report['peak_memory_bytes'] / 2 ** 20:7.1f}MiB", file=file)
+
+
+def describe(value):
+    """Summarize a stage input or output by its shape and size instead of its content."""
+    if isinstance(value, np.ndarray):
+        return {'shape': list(value.shape), 'bytes': int(value.nbytes)}
+    if isinstance(value, SparseGrid):
+        return {'occupied_bins': len(value.keys), 'bytes': int(value.keys.nbytes + value.values.nbytes)}
+    if isinstance(value, (list, tuple)):
+        if len(value) > DESCRIBE_MAX_ITEMS:
+            return {'length': len(value)}  # Long lists (of points...) are not walked in profiled code
+        items = [describe(item) for item in value]
+        return {'length': len(value), 'bytes': sum(item['bytes'] for item in items
+                                                   if isinstance(item, dict) and 'bytes' in item)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    return type(value).__name__
+
+
+def _short(value):
+    if isinstance(value, dict):
+        if 'shape' in value:
+            return 'x'.join(str(size) for size in value['shape']) or 'scalar'
+        if 'occupied_bins' in value:
+            return f"{value['occupied_bins']} bins"
+        if 'length' in value:
+            return f"{value['length']} items"
+    return str(value)
@@ -0,0 +1,85 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from csv_index import load_row_index
+from histogram_engine import HistogramAccumulator, difference_grid
+from read_csv import load_data_for_file
+from time_index import resolve_time_bounds
+
+
+def streamed_subtraction_histograms_avg_loc(config, graph_config1, graph_config2, bins, chunk_rows, workers=None):
+    """
+    Out-of-core equivalent of subtraction_histograms_avg_loc followed by average_loc_of_points_per_bin.
+
+    The files of both graphs are split into chunks of at most chunk_rows rows which are processed in a process
+    pool, so only a few chunks are in memory at once. A first pass finds the common grid from the range of every
+    chunk, a second one accumulates a partial HistogramAccumulator per chunk and merges them in order.
+
+    The CSVs are always parsed directly, whatever config['csv_cache'] says: building the columnar cache holds a
+    whole file in memory. The chunks seek to their rows through the row index, which is built by streaming.
+
+    Parameters:
+        config (dict): The config section, as for load_data_for_graph.
+        graph_config1 (dict): Graph config of the first set of points.
+        graph_config2 (dict): Graph config of the second set of points.
+        bins (Sequence[int]): Number of bins for the histogram in each dimension.
+        chunk_rows (int): Maximum number of CSV rows loaded by a worker at once.
+        workers (int or None): Size of the process pool, None for one per cpu.
+
+    Returns:
+        avg_hist1 (ndarray): Average value of the first set of points in each bin.
+        avg_hist2 (ndarray): Average value of the second set of points in each bin.
+        diff_hist (ndarray): Difference between the average histograms.
+        common_edges (list of ndarray): Bin edges.
+        average_locations1 (ndarray): Array of shape (*bins, 3), average location of the first set in each bin.
+        average_locations2 (ndarray): Array of shape (*bins, 3), average location of the second set in each bin.
+    """
+    config = dict(config, csv_cache=False)
+    graph_chunks = [split_graph_files(config, graph_config, chunk_rows) for graph_config in (graph_config1, graph_config2)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Define a common grid for rebinning based on the range of all points
+        bounds = executor.map(partial(_chunk_bounds, config), graph_chunks[0] + graph_chunks[1])
+        bounds = [chunk_bounds for chunk_bounds in bounds if chunk_bounds is not None]
+        mins = np.min([chunk_min for chunk_min, _ in bounds], axis=0)
+        maxs = np.max([chunk_max for _, chunk_max in bounds], axis=0)
+        common_edges = [np.linspace(mins[i], maxs[i], bins[i] + 1) for i in range(3)]
+
+        accumulators = []
+        for chunks in graph_chunks:
+            accumulator = HistogramAccumulator(common_edges, track_locations=True)
+            for chunk_accumulator in executor.map(partial(_chunk_histogram, config, common_edges), chunks):
+                accumulator.merge(chunk_accumulator)
+            accumulators.append(accumulator)
+
+    avg_hist1, _ = accumulators[0].average()
+    avg_hist2, _ = accumulators[1].average()
+    diff_hist = difference_grid(avg_hist1, avg_hist2)
+    average_locations1 = accumulators[0].average_locations()
+    average_locations2 = accumulators[1].average_locations()
+    return avg_hist1, avg_hist2, diff_hist, common_edges, average_locations1, average_locations2
+
+
+def split_graph_files(config, graph_config, chunk_rows):
+    """Split the row range of every file of a graph into file configs of at most chunk_rows rows."""
+    chunks = []
+    for file_config in graph_config['files']:
+        _, rows = load_row_index(file_config['csv_file_path'])  # Built here, once, before the workers seek with it
+        row_config = resolve_time_bounds(config, file_config)
+        start_row, end_row, _ = slice(row_config.get('start_row'), row_config.get('end_row')).indices(rows)
+        for chunk_start in range(start_row, end_row, chunk_rows):
+            chunks.append(dict(row_config, start_row=chunk_start, end_row=min(chunk_start + chunk_rows, end_row)))
+    return chunks
+
+
+def _chunk_bounds(config, file_config):
+    history_location, _ = load_data_for_file(config, file_config)
+    if history_location.shape[1] == 0:
+        return None
+    return history_location.min(axis=1), history_location.max(axis=1)
+
+
+def _chunk_histogram(config, common_edges, file_config):
+    history_location, history_info = load_data_for_file(config, file_config)
+    return HistogramAccumulator(common_edges, track_locations=True).add(history_location, history_info)
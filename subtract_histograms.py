@@ -1,9 +1,21 @@
+from functools import reduce
 from typing import Sequence
 import numpy as np
-import matplotlib.pyplot as plt
 
+from histogram_engine import average_grid, binned_mean_location, binned_statistics, difference_grid
+from sparse_histogram import SparseGrid, SparseHistogram
 
-def subtraction_histograms(sample1, values1, sample2, values2, bins: Sequence[int]):
+
+def common_histogram_edges(sample1, sample2, bins: Sequence[int]):
+    """Create a single set of bin edges spanning the range of the points of both samples."""
+    # Define a common grid for rebinning based on the range of all points
+    ranges = [
+        (min(np.min(sample1[i]), np.min(sample2[i])), max(np.max(sample1[i]), np.max(sample2[i])))
+        for i in range(3)
+    ]
+    return [np.linspace(r[0], r[1], bins[i] + 1) for i, r in enumerate(ranges)]
+
+def subtraction_histograms(sample1, values1, sample2, values2, bins: Sequence[int], sparse=False):
     """
     Compute the difference between two 3D histograms where bins represent average values in 3D space.
     Only include bins where both histograms have valid values.
@@ -14,42 +26,32 @@ def subtraction_histograms(sample1, values1, sample2, values2, bins: Sequence[in
         sample2 (list of ndarray): List of x, y, z coordinates for the second set of points.
         values2 (ndarray): Values associated with points in the second set.
         bins (int or Sequence[int]): Number of bins for the histogram in each dimension.
+        sparse (bool): Keep only the occupied bins, diff_hist is then a SparseGrid.
 
     Returns:
-        diff_hist (ndarray): Difference between histograms.
+        diff_hist (ndarray or SparseGrid): Difference between histograms.
         edges (list of ndarray): Bin edges.
     """
-    # Define a common grid for rebinning based on the range of all points
-    ranges = [
-        (min(np.min(sample1[i]), np.min(sample2[i])), max(np.max(sample1[i]), np.max(sample2[i])))
-        for i in range(3)
-    ]
-
-    # Create a single set of bin edges for all datasets
-    common_edges = [np.linspace(r[0], r[1], bins[i] + 1) for i, r in enumerate(ranges)]
+    common_edges = common_histogram_edges(sample1, sample2, bins)
+    if sparse:
+        diff_hist = SparseHistogram.from_points(sample1, values1, common_edges).average().subtract(
+            SparseHistogram.from_points(sample2, values2, common_edges).average())
+        return diff_hist, common_edges
 
-    # Rebin both datasets
-    hist_sum1, _ = np.histogramdd(sample1.T, bins=common_edges, weights=values1)
-    hist_count1, _ = np.histogramdd(sample1.T, bins=common_edges)
-
-    hist_sum2, _ = np.histogramdd(sample2.T, bins=common_edges, weights=values2)
-    hist_count2, _ = np.histogramdd(sample2.T, bins=common_edges)
+    # Rebin both datasets, each point is binned once for both its sum and its count
+    hist_sum1, hist_count1 = binned_statistics(sample1, values1, common_edges)
+    hist_sum2, hist_count2 = binned_statistics(sample2, values2, common_edges)
 
     # Calculate average histograms with the common grid
-    with np.errstate(divide='ignore', invalid='ignore'):
-        avg_hist1 = hist_sum1 / hist_count1
-        avg_hist2 = hist_sum2 / hist_count2
-        avg_hist1[hist_count1 == 0] = np.nan
-        avg_hist2[hist_count2 == 0] = np.nan
+    avg_hist1 = average_grid(hist_sum1, hist_count1)
+    avg_hist2 = average_grid(hist_sum2, hist_count2)
 
     # Subtract histograms where both have valid (non-NaN) values
-    with np.errstate(invalid='ignore'):
-        diff_hist = avg_hist1 - avg_hist2
-        diff_hist[np.isnan(avg_hist1) | np.isnan(avg_hist2)] = np.nan
+    diff_hist = difference_grid(avg_hist1, avg_hist2)
 
     return diff_hist, common_edges
 
-def subtraction_histograms_avg_loc(sample1, values1, sample2, values2, bins):
+def subtraction_histograms_avg_loc(sample1, values1, sample2, values2, bins, sparse=False):
     """
     Compute the difference between two 3D histograms where bins represent average positions of points in 3D space.
     Only include bins where both histograms have valid values.
@@ -60,6 +62,7 @@ def subtraction_histograms_avg_loc(sample1, values1, sample2, values2, bins):
         sample2 (list of ndarray): List of x, y, z coordinates for the second set of points.
         values2 (ndarray): Values associated with points in the second set.
         bins (int or Sequence[int]): Number of bins for the histogram in each dimension.
+        sparse (bool): Keep only the occupied bins, the histograms are then SparseGrid objects.
 
     Returns:
         diff_hist (ndarray): Difference between histograms.
@@ -67,108 +70,73 @@ def subtraction_histograms_avg_loc(sample1, values1, sample2, values2, bins):
         avg_positions_sample1 (ndarray): Average positions of points in sample1 for each bin.
         avg_positions_sample2 (ndarray): Average positions of points in sample2 for each bin.
     """
-    # Define a common grid for rebinning based on the range of all points
-    ranges = [
-        (min(np.min(sample1[i]), np.min(sample2[i])), max(np.max(sample1[i]), np.max(sample2[i])))
-        for i in range(3)
-    ]
-
-    # Create a single set of bin edges for all datasets
-    common_edges = [np.linspace(r[0], r[1], bins[i] + 1) for i, r in enumerate(ranges)]
+    common_edges = common_histogram_edges(sample1, sample2, bins)
+    if sparse:
+        avg_hist1 = SparseHistogram.from_points(sample1, values1, common_edges).average()
+        avg_hist2 = SparseHistogram.from_points(sample2, values2, common_edges).average()
+        return avg_hist1, avg_hist2, avg_hist1.subtract(avg_hist2), common_edges
 
-    # Rebin both datasets
-    hist_sum1, _ = np.histogramdd(sample1.T, bins=common_edges, weights=values1)
-    hist_count1, _ = np.histogramdd(sample1.T, bins=common_edges)
-
-    hist_sum2, _ = np.histogramdd(sample2.T, bins=common_edges, weights=values2)
-    hist_count2, _ = np.histogramdd(sample2.T, bins=common_edges)
+    # Rebin both datasets, each point is binned once for both its sum and its count
+    hist_sum1, hist_count1 = binned_statistics(sample1, values1, common_edges)
+    hist_sum2, hist_count2 = binned_statistics(sample2, values2, common_edges)
 
     # Calculate the average histograms for both sample1 and sample2
-    with np.errstate(divide='ignore', invalid='ignore'):
-        avg_hist1 = hist_sum1 / hist_count1
-        avg_hist2 = hist_sum2 / hist_count2
-        avg_hist1[hist_count1 == 0] = np.nan
-        avg_hist2[hist_count2 == 0] = np.nan
+    avg_hist1 = average_grid(hist_sum1, hist_count1)
+    avg_hist2 = average_grid(hist_sum2, hist_count2)
 
     # Subtract histograms where both have valid (non-NaN) values
-    with np.errstate(invalid='ignore'):
-        diff_hist = avg_hist1 - avg_hist2
-        diff_hist[np.isnan(avg_hist1) | np.isnan(avg_hist2)] = np.nan
+    diff_hist = difference_grid(avg_hist1, avg_hist2)
 
     return avg_hist1, avg_hist2, diff_hist, common_edges
 
-def average_loc_of_points_per_bin(sample1, sample2, common_edges):
-    # Digitize the points in each sample to find the bin indices for each dimension
-    bin_indices1 = [
-        np.digitize(sample1[i], common_edges[i]) - 1  # Adjust to 0-based indexing
-        for i in range(3)
-    ]
-    bin_indices2 = [
-        np.digitize(sample2[i], common_edges[i]) - 1  # Adjust to 0-based indexing
-        for i in range(3)
-    ]
-
-    # Stack the indices to get a unique bin identifier for each point
-    bin_indices1 = np.stack(bin_indices1, axis=-1)
-    bin_indices2 = np.stack(bin_indices2, axis=-1)
-
-    # Create a dictionary to store points in each bin for sample1 and sample2
-    from collections import defaultdict
-
-    points_in_bins1 = defaultdict(list)
-    points_in_bins2 = defaultdict(list)
-
-    # Fill the dictionary for sample1
-    for point, bin_idx in zip(sample1.T, bin_indices1):
-        points_in_bins1[tuple(bin_idx)].append(point)
-
-    # Fill the dictionary for sample2
-    for point, bin_idx in zip(sample2.T, bin_indices2):
-        points_in_bins2[tuple(bin_idx)].append(point)
-
-    # Convert lists to numpy arrays for easier manipulation
-    points_in_bins1 = {k: np.array(v) for k, v in points_in_bins1.items()}
-    points_in_bins2 = {k: np.array(v) for k, v in points_in_bins2.items()}
+def average_loc_of_points_per_bin(sample1, sample2, common_edges, sparse=False):
+    """
+    Compute the average location of the points of each sample in every bin of the common grid.
 
-    # To calculate the average location of points in each bin:
-    average_locations1 = {k: np.mean(v, axis=0) for k, v in points_in_bins1.items()}
-    average_locations2 = {k: np.mean(v, axis=0) for k, v in points_in_bins2.items()}
+    Parameters:
+        sample1 (ndarray): Array of shape (3, N1) of x, y, z coordinates of the first set of points.
+        sample2 (ndarray): Array of shape (3, N2) of x, y, z coordinates of the second set of points.
+        common_edges (list of ndarray): Bin edges, as returned by subtraction_histograms_avg_loc.
+        sparse (bool): Keep only the occupied bins, the results are then SparseGrid objects of (K, 3) values.
 
+    Returns:
+        average_locations1 (ndarray): Array of shape (*bins, 3), NaN in bins without points of sample1.
+        average_locations2 (ndarray): Array of shape (*bins, 3), NaN in bins without points of sample2.
+    """
+    if sparse:
+        average_locations1 = SparseHistogram.from_points(sample1, np.zeros(np.shape(sample1)[1]), common_edges,
+                                                         track_locations=True).average_locations()
+        average_locations2 = SparseHistogram.from_points(sample2, np.zeros(np.shape(sample2)[1]), common_edges,
+                                                         track_locations=True).average_locations()
+        return average_locations1, average_locations2
+    average_locations1 = binned_mean_location(sample1, common_edges)
+    average_locations2 = binned_mean_location(sample2, common_edges)
     return average_locations1, average_locations2
 
 
 def average_loc_and_corresponding_dif(average_locations1, average_locations2, avg_value_hist1, avg_value_hist2):
-    # Create lists to store final averaged locations and corresponding values
-    final_locations = []
-    final_values = []
-
-    # Iterate over all possible bins in average_locations1 and average_locations2
-    for bin_idx in average_locations1.keys():
-        loc1 = average_locations1.get(bin_idx, None)
-        loc2 = average_locations2.get(bin_idx, None)
-        val1 = avg_value_hist1[tuple(bin_idx)] if np.all(bin_idx < np.array(avg_value_hist1.shape)) else np.nan
-        val2 = avg_value_hist2[tuple(bin_idx)] if np.all(bin_idx < np.array(avg_value_hist2.shape)) else np.nan
-
-        # Check if both locations and both values are valid (not NaN)
-        if loc1 is not None and not np.isnan(loc1).any() and \
-                loc2 is not None and not np.isnan(loc2).any() and \
-                not np.isnan(val1) and not np.isnan(val2):
-            # Calculate the average location
-            avg_location = (loc1 + loc2) / 2
-            # Calculate the value difference
-            value_diff = val1 - val2
-
-            # Append to the lists
-            final_locations.append(avg_location)
-            final_values.append(value_diff)
-
-    # Convert lists to numpy arrays
-    final_locations = np.array(final_locations)
-    final_values = np.array(final_values)
-
-    # Sanity check: Ensure lengths of final_locations and final_values match
-    if len(final_locations) != len(final_values):
-        raise ValueError("Mismatch between lengths of final locations and final values!")
+    """
+    Pair the bins where both samples have points and values. Accepts dense grids or SparseGrid objects.
+
+    Returns:
+        final_locations (ndarray): Array of shape (M, 3), the mean of the two average locations of each such bin.
+        final_values (ndarray): Array of shape (M,), avg_value_hist1 - avg_value_hist2 in each such bin.
+    """
+    if isinstance(average_locations1, SparseGrid):
+        # Bins present in all four grids, in C order like the dense grids
+        keys = reduce(np.intersect1d, [grid.keys for grid in
+                                       (average_locations1, average_locations2, avg_value_hist1, avg_value_hist2)])
+        average_locations1, average_locations2, avg_value_hist1, avg_value_hist2 = [
+            grid.values[np.searchsorted(grid.keys, keys)]
+            for grid in (average_locations1, average_locations2, avg_value_hist1, avg_value_hist2)]
+
+    # Check if both locations and both values are valid (not NaN)
+    valid = ~np.isnan(average_locations1).any(axis=-1) & ~np.isnan(average_locations2).any(axis=-1) & \
+        ~np.isnan(avg_value_hist1) & ~np.isnan(avg_value_hist2)
+
+    # Calculate the average location and the value difference
+    final_locations = (average_locations1[valid] + average_locations2[valid]) / 2
+    final_values = avg_value_hist1[valid] - avg_value_hist2[valid]
 
     return final_locations, final_values
 
@@ -196,6 +164,8 @@ def plot_3d_locations_with_values(final_locations, final_values, cmap='viridis')
     if final_values.ndim != 1:
         raise ValueError("final_values must be a 1D array.")
 
+    import matplotlib.pyplot as plt
+
     # Create 3D scatter plot
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111, projection='3d')
@@ -0,0 +1,198 @@
+"""
+Synthetic telemetry CSVs in the downlink_saver schema, for benchmarks and tests without real flights.
+
+A flight sweeps a square area around an origin in one of several patterns, one altitude layer after the other. Link
+percents fall off with distance from the origin; a planted source, when switched on, adds a Gaussian bump around a
+line that rises from the source (tilted by `tilt`). A flight with the source on and one with it off give the two
+graphs the subtraction pipeline compares.
+
+    python synthetic_flight.py flights/ --rows 1000000 --pattern lawnmower --layers 100 150 200
+"""
+import csv
+import json
+import os
+from argparse import ArgumentParser
+
+import numpy as np
+
+from chunked_columns import CHUNK_ROWS
+from telemetry_writer import TELEMETRY_FIELDNAMES
+
+PATTERNS = ['lawnmower', 'spiral', 'random']
+METERS_PER_DEGREE = 111320.0
+RSSI_RANGE = (-110, -40)  # Integer dBm, one signalInterference string per value is prepared up front
+
+
+def generate_flight(csv_file_path, rows, pattern='lawnmower', layers=(100, 150, 200), origin=(34.655, 31.632),
+                    extent_m=600.0, source=(34.654, 31.631, 77.0), source_on=True, source_strength=80.0,
+                    source_radius_m=40.0, tilt=(0.0, 0.0), frequencies=(2400.0, 2420.0, 2440.0, 2460.0),
+                    rate_hz=30.0, seed=0, chunk_rows=CHUNK_ROWS):
+    """
+    Write a synthetic flight of `rows` telemetry rows, generating and writing chunk_rows rows at a time.
+
+    Parameters:
+        csv_file_path (str): Output CSV path.
+        rows (int): Number of telemetry rows.
+        pattern (str): 'lawnmower' (back and forth lines), 'spiral' or 'random' positions over each layer.
+        layers (Sequence[float]): aboveSeaLevel of each altitude layer, flown in order with rows split evenly.
+        origin (Sequence[float]): (lon, lat) of the centre of the flown square.
+        extent_m (float): Side of the flown square in metres.
+        source (Sequence[float]): (lon, lat, asl) of the planted source.
+        source_on (bool): Whether the source affects the link percents and RSSI of this flight.
+        source_strength (float): Link percent added at the source.
+        source_radius_m (float): Standard deviation in metres of the source's bump.
+        tilt (Sequence[float]): Horizontal metres the bump's centre moves per metre above the source (east, north).
+        frequencies (Sequence[float]): frequencyFrom of the signalInterference entries of every row.
+        rate_hz (float): Telemetry rate, for videoNanoTime.
+        seed (int): Seed of the noise, the same arguments always write the same file.
+    """
+    rng = np.random.default_rng(seed)
+    layers = np.asarray(layers, dtype=np.float64)
+    interference_cells = _signal_interference_cells(frequencies)
+    with open(csv_file_path, mode='w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(TELEMETRY_FIELDNAMES)
+        for start in range(0, rows, chunk_rows):
+            index = np.arange(start, min(start + chunk_rows, rows))
+            lon, lat, asl = flight_positions(index, rows, pattern, layers, origin, extent_m, rng)
+            downlink, uplink, rssi = link_quality(lon, lat, asl, origin, extent_m, source, source_on,
+                                                  source_strength, source_radius_m, tilt, rng)
+            nano_time = (index * (1e9 / rate_hz)).astype(np.int64)
+            rssi_index = np.clip(np.round(rssi).astype(np.int64), *RSSI_RANGE) - RSSI_RANGE[0]
+            writer.writerows(zip(nano_time.tolist(), lat.tolist(), lon.tolist(), asl.round(2).tolist(),
+                                 uplink.round(1).tolist(), downlink.round(1).tolist(),
+                                 [interference_cells[i] for i in rssi_index.tolist()]))
+
+
+def generate_flight_pair(directory, rows, seed=0, **kwargs):
+    """
+    Write a flight with the source on and one with it off (with independent noise) into `directory`.
+
+    Returns:
+        with_source_path (str), without_source_path (str)
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, source_on, flight_seed in [('with_source', True, seed), ('without_source', False, seed + 1)]:
+        path = os.path.join(directory, f"{name}_{kwargs.get('pattern', 'lawnmower')}_{rows}.csv")
+        generate_flight(path, rows, source_on=source_on, seed=flight_seed, **kwargs)
+        paths.append(path)
+    return tuple(paths)
+
+
+def flight_config(with_source_path, without_source_path, source=(34.654, 31.631, 77.0), data='downlink', **overrides):
+    """Return a csv_lines_config.yaml section comparing the two flights of generate_flight_pair."""
+    config = {
+        'data': data,
+        'filter_middle_info': False,
+        'high_info_floor': 80,
+        'low_info_ceil': 35,
+        'histogram_bins': [30, 30, 30],
+        'histogram_bins_difference_graph': [30, 30, 30],
+        'show_shabash': False,
+        'shabash_loc': list(source),
+        'real_shabash_loc': list(source),
+        'ground_asl': source[2],
+        'graphs': [
+            {'title': 'with source', 'files': [{'csv_file_path': with_source_path, 'start_row': None,
+                                                 'end_row': None}]},
+            {'title': 'without source', 'files': [{'csv_file_path': without_source_path, 'start_row': None,
+                                                    'end_row': None}]},
+        ],
+    }
+    config.update(overrides)
+    return config
+
+
+def flight_positions(index, rows, pattern, layers, origin, extent_m, rng):
+    """Return the lon, lat and asl of the telemetry rows `index` of a flight of `rows` rows."""
+    rows_per_layer = -(-rows // len(layers))
+    layer = index // rows_per_layer
+    progress = (index % rows_per_layer) / rows_per_layer  # Fraction of the current layer flown, in [0, 1)
+
+    if pattern == 'lawnmower':
+        n_lines = 20
+        line, along = np.divmod(progress * n_lines, 1)
+        x = np.where(line % 2 == 0, along, 1 - along)
+        y = line / (n_lines - 1)
+    elif pattern == 'spiral':
+        turns = 10
+        radius = 0.5 * np.sqrt(progress)  # Constant speed-ish: the area covered grows linearly
+        angle = 2 * np.pi * turns * np.sqrt(progress)
+        x, y = 0.5 + radius * np.cos(angle), 0.5 + radius * np.sin(angle)
+    elif pattern == 'random':
+        x, y = rng.random(len(index)), rng.random(len(index))
+    else:
+        raise ValueError(f"Unknown flight pattern: {pattern}, expected one of {PATTERNS}")
+
+    east_m, north_m = (x - 0.5) * extent_m, (y - 0.5) * extent_m
+    lon, lat = _offset_degrees(origin, east_m, north_m)
+    asl = layers[layer] + rng.normal(0, 0.3, len(index))
+    return lon, lat, asl
+
+
+def link_quality(lon, lat, asl, origin, extent_m, source, source_on, source_strength, source_radius_m, tilt, rng):
+    """Return the downlink and uplink percents and the RSSI of each position."""
+    east_m, north_m = _offset_meters(origin, lon, lat)
+    distance_m = np.hypot(east_m, north_m)
+    # Low baselines leave room below 100% for the source's bump
+    downlink = 20 - 10 * distance_m / extent_m
+    uplink = 15 - 8 * distance_m / extent_m
+    rssi = -95 + 20 * np.exp(-distance_m / extent_m)
+
+    if source_on:
+        source_east_m, source_north_m = _offset_meters(origin, source[0], source[1])
+        height = asl - source[2]
+        bump = np.exp(-0.5 * ((east_m - source_east_m - tilt[0] * height) ** 2 +
+                              (north_m - source_north_m - tilt[1] * height) ** 2) / source_radius_m ** 2)
+        downlink = downlink + source_strength * bump
+        uplink = uplink + 0.5 * source_strength * bump
+        rssi = rssi + 40 * bump
+
+    downlink = np.clip(downlink + rng.normal(0, 4, len(lon)), 0, 100)
+    uplink = np.clip(uplink + rng.normal(0, 4, len(lon)), 0, 100)
+    rssi = rssi + rng.normal(0, 2, len(lon))
+    return downlink, uplink, rssi
+
+
+def _signal_interference_cells(frequencies):
+    """One signalInterference cell per integer RSSI, formatted as CsvTelemetryWriter records it."""
+    cells = []
+    for rssi in range(RSSI_RANGE[0], RSSI_RANGE[1] + 1):
+        entries = [{'frequencyFrom': frequency, 'frequencyTo': frequency + 20.0, 'rssi': rssi + offset}
+                   for offset, frequency in enumerate(frequencies)]
+        cells.append(json.dumps(entries, separators=(',', ':')))
+    return cells
+
+
+def _offset_degrees(origin, east_m, north_m):
+    lat = origin[1] + north_m / METERS_PER_DEGREE
+    lon = origin[0] + east_m / (METERS_PER_DEGREE * np.cos(np.radians(origin[1])))
+    return lon, lat
+
+
+def _offset_meters(origin, lon, lat):
+    east_m = (np.asarray(lon) - origin[0]) * METERS_PER_DEGREE * np.cos(np.radians(origin[1]))
+    north_m = (np.asarray(lat) - origin[1]) * METERS_PER_DEGREE
+    return east_m, north_m
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Write a pair of synthetic flights, with and without the source.')
+    parser.add_argument('directory', help='output directory')
+    parser.add_argument('--rows', type=int, default=100000, help='telemetry rows per flight')
+    parser.add_argument('--pattern', choices=PATTERNS, default='lawnmower')
+    parser.add_argument('--layers', type=float, nargs='+', default=[100, 150, 200], help='aboveSeaLevel of each layer')
+    parser.add_argument('--source', type=float, nargs=3, default=[34.654, 31.631, 77.0], metavar=('LON', 'LAT', 'ASL'))
+    parser.add_argument('--tilt', type=float, nargs=2, default=[0.0, 0.0], metavar=('EAST', 'NORTH'),
+                        help='horizontal metres the source bump moves per metre of height')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    paths = generate_flight_pair(args.directory, args.rows, seed=args.seed, pattern=args.pattern, layers=args.layers,
+                                 source=args.source, tilt=args.tilt)
+    print('\n'.join(paths))
+
+
+if __name__ == '__main__':
+    main()
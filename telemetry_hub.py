@@ -0,0 +1,273 @@
+"""
+Single event-loop ingest of the telemetry TCP stream, fanned out to any number of subscribers.
+
+The hub owns the connection to the telemetry port and publishes every parsed message to the subscriptions that
+asked for its messageType. Each subscription has its own bounded queue and backpressure policy:
+    'block': the hub waits for room, nothing is lost (for the recorder, which must keep every sample).
+    'drop_oldest': the oldest queued message makes room (for live views that only care about recent data).
+    'drop_newest': the new message is dropped when the queue is full.
+so a slow plot only ever loses its own messages and never stalls recording.
+
+Every message is stamped with its monotonic receive time (time.monotonic_ns) when its line is read. Subscriptions
+created with timestamps=True get (receive time in ns, message) pairs instead of bare messages.
+
+The loop runs in a background thread started by start(). Coroutines on that loop can consume a subscription with
+`async for`, plain threads use its blocking get() and drain(), which hand over to the loop with
+asyncio.run_coroutine_threadsafe. stop() ends the stream, close() shuts the loop down once the consumers are done.
+"""
+import asyncio
+import json
+import threading
+import time
+
+POLICIES = ['block', 'drop_oldest', 'drop_newest']
+_END = object()  # Queued once the stream ended
+
+
+async def _skip_line(reader, consumed):
+    """
+    Discard an oversized line, `consumed` bytes of which are buffered, up to and including its newline.
+    Returns False if the connection closed first.
+    """
+    try:
+        await reader.readexactly(consumed)
+        while True:
+            try:
+                await reader.readuntil(b'\n')
+                return True
+            except asyncio.LimitOverrunError as error:
+                await reader.readexactly(error.consumed)
+    except asyncio.IncompleteReadError:
+        return False
+
+
+class Subscription:
+    def __init__(self, hub, name, maxsize, policy, message_type, timestamps=False):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}, expected one of {POLICIES}")
+        self.hub = hub
+        self.name = name
+        self.policy = policy
+        self.message_type = message_type
+        self.timestamps = timestamps
+        self.queue = asyncio.Queue(maxsize)  # (receive time in ns, message) items
+        self.delivered = 0
+        self.dropped = 0
+        self.ended = False
+
+    async def put(self, message, receive_time_ns):
+        """Queue a message according to the backpressure policy. Runs on the hub's loop."""
+        message = (receive_time_ns, message)
+        if self.policy == 'block':
+            await self.queue.put(message)
+        elif self.queue.full():
+            if self.policy == 'drop_newest':
+                self.dropped += 1
+                return
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.queue.put_nowait(message)
+        else:
+            self.queue.put_nowait(message)
+        self.delivered += 1
+
+    async def end(self):
+        """Mark the end of the stream. Dropping policies make room for the marker if the queue is full."""
+        if self.policy == 'block':
+            await self.queue.put(_END)
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(_END)
+
+    async def next(self):
+        """
+        The next message, or (receive time in ns, message) with timestamps, None once the stream ended and every
+        queued message was consumed.
+        """
+        if self.ended:
+            return None
+        message = await self.queue.get()
+        if message is _END:
+            self.ended = True
+            return None
+        return self._unpack(message)
+
+    async def next_batch(self):
+        """Every message queued right now, without waiting."""
+        messages = []
+        while not self.queue.empty() and not self.ended:
+            message = self.queue.get_nowait()
+            if message is _END:
+                self.ended = True
+            else:
+                messages.append(self._unpack(message))
+        return messages
+
+    def _unpack(self, item):
+        return item if self.timestamps else item[1]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.next()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def next_within(self, timeout=None):
+        """
+        The next message, waiting at most timeout seconds. Raises TimeoutError if none arrives.
+
+        The wait is cancelled on the loop while the getter still waits, so a timed out get never consumes a message.
+        """
+        if timeout is None:
+            return await self.next()
+        getter = asyncio.ensure_future(self.next())
+        done, _ = await asyncio.wait([getter], timeout=timeout)
+        if not done:
+            getter.cancel()
+            raise TimeoutError(f"no telemetry for {self.name} within {timeout}s")
+        return getter.result()
+
+    def get(self, timeout=None):
+        """Blocking get from another thread, see next_within."""
+        return asyncio.run_coroutine_threadsafe(self.next_within(timeout), self.hub.loop).result()
+
+    def drain(self):
+        """Every message queued right now, from another thread, without waiting for new ones."""
+        return asyncio.run_coroutine_threadsafe(self.next_batch(), self.hub.loop).result()
+
+
+class TelemetryHub:
+    """
+    Owner of the telemetry connection publishing its messages to subscriptions.
+
+    Parameters:
+        port (int): Telemetry TCP port.
+        host (str): Telemetry host.
+        max_message_bytes (int): Longest accepted message, longer lines are skipped.
+    """
+
+    def __init__(self, port=44000, host='127.0.0.1', max_message_bytes=1 << 20):
+        self.port = port
+        self.host = host
+        self.max_message_bytes = max_message_bytes
+        self.subscriptions = []
+        self.latest = {}  # messageType -> latest message of that type
+        self.latest_receive_time_ns = {}  # messageType -> monotonic receive time of its latest message
+        self.decode_errors = 0
+        self.error = None  # Exception that ended the stream, if any
+        self.loop = None
+        self._thread = None
+        self._task = None
+        self.finished = threading.Event()
+
+    def subscribe(self, name, maxsize=1024, policy='drop_oldest', message_type='telemetry', timestamps=False):
+        """
+        Add a subscription, before start() to see the stream from its first message.
+
+        Parameters:
+            name (str): Name of the consumer, for the statistics.
+            maxsize (int): Capacity of its queue.
+            policy (str): Backpressure policy when the queue is full, one of POLICIES.
+            message_type (str or None): Only receive messages of this messageType, None for all messages.
+            timestamps (bool): Receive (monotonic receive time in ns, message) pairs instead of bare messages.
+        """
+        subscription = Subscription(self, name, maxsize, policy, message_type, timestamps)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def latest_telemetry(self):
+        """A copy of the latest telemetry message, None if none was received yet."""
+        telemetry = self.latest.get('telemetry')
+        return None if telemetry is None else dict(telemetry)
+
+    async def run(self):
+        """Read newline-separated JSON messages until the connection closes and publish them."""
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port, limit=self.max_message_bytes)
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                    receive_time_ns = time.monotonic_ns()
+                except asyncio.IncompleteReadError:
+                    break  # Connection closed, a partial last line is dropped
+                except asyncio.LimitOverrunError as error:
+                    self.decode_errors += 1  # One error per oversized message, its rest is discarded unparsed
+                    if not await _skip_line(reader, error.consumed):
+                        break
+                    continue
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError as error:
+                    self.decode_errors += 1
+                    print(f"JSON Decode Error: {error}")
+                    continue
+                await self.publish(message, receive_time_ns)
+        except ConnectionRefusedError as error:
+            print('record is off, please start it')
+            self.error = error
+        except ConnectionResetError as error:
+            self.error = error
+        finally:
+            if writer is not None:
+                print('record ended')
+                writer.close()
+            for subscription in self.subscriptions:
+                await subscription.end()
+            self.finished.set()
+
+    async def publish(self, message, receive_time_ns=None):
+        """Fan a message out to the subscriptions for its messageType, stamped now unless a receive time is given."""
+        receive_time_ns = time.monotonic_ns() if receive_time_ns is None else receive_time_ns
+        message_type = message.get('messageType')
+        self.latest[message_type] = message
+        self.latest_receive_time_ns[message_type] = receive_time_ns
+        for subscription in self.subscriptions:
+            if subscription.message_type is None or subscription.message_type == message_type:
+                await subscription.put(message, receive_time_ns)
+
+    def start(self):
+        """Run the hub's event loop in a daemon thread and connect."""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='telemetry-hub', daemon=True)
+        self._thread.start()
+        self._task = asyncio.run_coroutine_threadsafe(self.run(), self.loop)
+        return self
+
+    def stop(self, timeout=5):
+        """
+        Disconnect and end every subscription. The loop keeps running, so consumers can still get the messages
+        queued before the end, call close() once they are done.
+        """
+        if self._task is not None:
+            self._task.cancel()  # Cancels the coroutine on the loop, which then ends the subscriptions
+        self.finished.wait(timeout)
+
+    def close(self, timeout=5):
+        """Stop (if still running) and shut the event loop down."""
+        if self.loop is None:
+            return
+        self.stop(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+
+    def isFinished(self):
+        return self.finished.is_set()
+
+    def statistics(self):
+        """Delivered and dropped message counts of each subscription."""
+        return {subscription.name: {'delivered': subscription.delivered, 'dropped': subscription.dropped,
+                                    'queued': subscription.queue.qsize()} for subscription in self.subscriptions}
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
@@ -0,0 +1,279 @@
+"""
+Persistent, batched telemetry recorders for downlink_saver.
+
+Rows are kept in memory and written in batches once `flush_rows` rows are pending or `flush_interval_s` passed since
+the last write, so the display loop never opens files or waits for the disk per row. Closing (or rotating) a file
+flushes and fsyncs it, so every finished part is complete on disk and a crash loses at most the pending batch.
+
+Two formats are available:
+    CsvTelemetryWriter: the telemetry CSV read by read_csv/csv_cache, with signalInterference as JSON.
+    BinaryTelemetryWriter: append-only length-prefixed records with a CRC, read back by read_binary_telemetry or
+        converted with binary_to_csv. A torn record at the end of a crashed recording is detected and skipped.
+
+TelemetryRecorder feeds a writer from a telemetry hub subscription in its own thread, at the telemetry's own rate.
+"""
+import csv
+import json
+import math
+import os
+import struct
+import time
+import zlib
+from abc import ABC, abstractmethod
+from threading import Thread
+
+TELEMETRY_FIELDNAMES = ["videoNanoTime", "lat", "lon", "aboveSeaLevel", "upLinkPercent", "downLinkPercent",
+                        "signalInterference"]
+
+BINARY_MAGIC = b'TLMREC1\n'
+_RECORD_HEADER = struct.Struct('<II')  # payload length, crc32 of the payload
+_RECORD_FIELDS = struct.Struct('<qddddd')  # videoNanoTime, lat, lon, aboveSeaLevel, upLinkPercent, downLinkPercent
+_ENTRY_COUNT = struct.Struct('<H')
+_ENTRY = struct.Struct('<ddd')  # frequencyFrom, frequencyTo, rssi
+MISSING_NANO_TIME = -1  # Same marker as csv_cache
+
+
+class _BatchedWriter(ABC):
+    """
+    Batching, time-based flushing, fsync on close and rotation shared by the telemetry writers.
+
+    Subclasses implement the file format through _open, _encode and _write_batch.
+    """
+
+    def __init__(self, path, flush_rows=256, flush_interval_s=1.0, rotate_rows=None):
+        """
+        Parameters:
+            path (str): Output path. With rotation, later parts get a `_part<N>` suffix before the extension.
+            flush_rows (int): Write the pending rows once this many are batched.
+            flush_interval_s (float): Also write them once this long passed since the last write.
+            rotate_rows (int or None): Close the file and continue in a new part after this many rows.
+        """
+        if flush_rows < 1:
+            raise ValueError(f"flush_rows must be at least 1, got {flush_rows}")
+        if rotate_rows is not None and rotate_rows < 1:
+            raise ValueError(f"rotate_rows must be at least 1 (or None for no rotation), got {rotate_rows}")
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.rotate_rows = rotate_rows
+        self.paths = []
+        self.rows_written = 0
+        self._batch = []
+        self._part_rows = 0
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._open_part()
+
+    def write(self, telemetry):
+        """Queue one telemetry message (a dict as sent by the telemetry API) and flush if a threshold is reached."""
+        self._batch.append(self._encode(telemetry))
+        if len(self._batch) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def flush(self):
+        """Write the pending rows to the OS, rotating to a new part where rotate_rows says so."""
+        while self._batch:
+            if self._file is None:
+                self._open_part()  # Parts after the first are only created once they get rows
+            room = len(self._batch) if self.rotate_rows is None else self.rotate_rows - self._part_rows
+            batch, self._batch = self._batch[:room], self._batch[room:]
+            self._write_batch(batch)
+            self._part_rows += len(batch)
+            self.rows_written += len(batch)
+            if self.rotate_rows is not None and self._part_rows >= self.rotate_rows:
+                self._close_part()
+        if self._file is not None:
+            self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flush, fsync and close the current part."""
+        self.flush()
+        if self._file is not None:
+            self._close_part()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open_part(self):
+        root, extension = os.path.splitext(self.path)
+        path = self.path if not self.paths else f'{root}_part{len(self.paths) + 1}{extension}'
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = self._open(path, new_file)
+        self._part_rows = 0
+        self.paths.append(path)
+
+    def _close_part(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        _fsync_directory(os.path.dirname(os.path.abspath(self.paths[-1])))  # Make the new file's entry durable
+
+    @abstractmethod
+    def _open(self, path, new_file):
+        """Open a part for appending, writing its header if new_file. Returns the file object."""
+
+    @abstractmethod
+    def _encode(self, telemetry):
+        """Convert one telemetry message to the row kept in the batch."""
+
+    @abstractmethod
+    def _write_batch(self, batch):
+        """Write encoded rows to the current part."""
+
+
+class CsvTelemetryWriter(_BatchedWriter):
+    """
+    Telemetry CSV recorder. The header is written when a file is created, appending to an existing file keeps it.
+
+    signalInterference is written as JSON (double quotes), which the readers' fast path parses without
+    ast.literal_eval.
+    """
+
+    def __init__(self, path, fieldnames=TELEMETRY_FIELDNAMES, **kwargs):
+        self.fieldnames = list(fieldnames)
+        self._writer = None
+        super().__init__(path, **kwargs)
+
+    def _open(self, path, new_file):
+        file = open(path, mode='a', newline='')
+        self._writer = csv.writer(file)
+        if new_file:
+            self._writer.writerow(self.fieldnames)
+        return file
+
+    def _encode(self, telemetry):
+        row = []
+        for name in self.fieldnames:
+            value = telemetry.get(name)
+            if name == 'signalInterference' and value is not None and not isinstance(value, str):
+                value = json.dumps(value, separators=(',', ':'))
+            row.append('' if value is None else value)
+        return row
+
+    def _write_batch(self, batch):
+        self._writer.writerows(batch)
+
+
+class BinaryTelemetryWriter(_BatchedWriter):
+    """Telemetry recorder in the binary record format, see read_binary_telemetry."""
+
+    def _open(self, path, new_file):
+        file = open(path, mode='ab')
+        if new_file:
+            file.write(BINARY_MAGIC)
+        return file
+
+    def _encode(self, telemetry):
+        return encode_record(telemetry)
+
+    def _write_batch(self, batch):
+        self._file.write(b''.join(batch))
+
+
+class TelemetryRecorder(Thread):
+    """
+    Thread persisting every message of a subscription (see telemetry_hub) as soon as it arrives.
+
+    Recording doesn't depend on any display or video loop: the thread waits on the subscription, writes whatever is
+    queued, and closes the writer once the stream ended (after TelemetryHub.stop or when the connection closes).
+    Use a 'block' subscription so that no sample is dropped.
+    """
+
+    def __init__(self, subscription, writer):
+        super(TelemetryRecorder, self).__init__(name='telemetry-recorder')
+        self.subscription = subscription
+        self.writer = writer
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    telemetry = self.subscription.get(timeout=self.writer.flush_interval_s)
+                except TimeoutError:
+                    self.writer.flush()  # Quiet stream, don't keep the last rows pending
+                    continue
+                if telemetry is None:
+                    return  # Stream ended
+                self.writer.write(telemetry)
+                for telemetry in self.subscription.drain():  # Write what queued up meanwhile in one go
+                    self.writer.write(telemetry)
+        finally:
+            self.writer.close()
+
+
+def encode_record(telemetry):
+    """Encode one telemetry message as a binary record: length and CRC header, fixed fields, interference entries."""
+    nano_time = telemetry.get('videoNanoTime')
+    fields = [MISSING_NANO_TIME if nano_time is None else int(nano_time)]
+    fields += [_float_or_nan(telemetry.get(name)) for name in TELEMETRY_FIELDNAMES[1:6]]
+    entries = telemetry.get('signalInterference') or []
+    if isinstance(entries, str):
+        entries = json.loads(entries)
+    payload = b''.join([_RECORD_FIELDS.pack(*fields), _ENTRY_COUNT.pack(len(entries))] +
+                       [_ENTRY.pack(_float_or_nan(entry.get('frequencyFrom')), _float_or_nan(entry.get('frequencyTo')),
+                                    _float_or_nan(entry.get('rssi'))) for entry in entries])
+    return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_binary_telemetry(path):
+    """
+    Read the records of a binary telemetry file, stopping at the first torn or corrupt record.
+
+    Yields:
+        telemetry (dict): The fields of TELEMETRY_FIELDNAMES, None for missing values, signalInterference as a
+            list of {'frequencyFrom', 'frequencyTo', 'rssi'} dicts.
+    """
+    with open(path, mode='rb') as file:
+        if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary telemetry file")
+        while True:
+            header = file.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            length, crc = _RECORD_HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return  # Torn last record of a crashed recording
+            yield decode_record(payload)
+
+
+def decode_record(payload):
+    nano_time, *values = _RECORD_FIELDS.unpack_from(payload)
+    telemetry = {'videoNanoTime': None if nano_time == MISSING_NANO_TIME else nano_time}
+    telemetry.update((name, None if math.isnan(value) else value) for name, value in zip(TELEMETRY_FIELDNAMES[1:6],
+                                                                                          values))
+    count, = _ENTRY_COUNT.unpack_from(payload, _RECORD_FIELDS.size)
+    entries = _ENTRY.iter_unpack(payload[_RECORD_FIELDS.size + _ENTRY_COUNT.size:][:count * _ENTRY.size])
+    telemetry['signalInterference'] = [{'frequencyFrom': frequency_from, 'frequencyTo': frequency_to, 'rssi': rssi}
+                                       for frequency_from, frequency_to, rssi in entries]
+    return telemetry
+
+
+def binary_to_csv(binary_path, csv_file_path, fieldnames=TELEMETRY_FIELDNAMES):
+    """Convert a binary telemetry file to the telemetry CSV the analysis scripts read. Returns the rows written."""
+    with CsvTelemetryWriter(csv_file_path, fieldnames, flush_rows=65536, flush_interval_s=math.inf) as writer:
+        for telemetry in read_binary_telemetry(binary_path):
+            writer.write(telemetry)
+    return writer.rows_written
+
+
+def _float_or_nan(value):
+    return math.nan if value is None or value == '' else float(value)
+
+
+def _fsync_directory(directory):
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Not supported on this platform (e.g. Windows)
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
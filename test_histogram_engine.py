@@ -0,0 +1,21 @@
+import numpy as np
+
+from histogram_engine import HistogramAccumulator
+
+
+def test_growth_is_capped_by_max_bins():
+    # A GPS row without a fix (lat/lon 0) mustn't grow a live grid centred on the flight to cover it
+    accumulator = HistogramAccumulator.around((34.657, 31.6457, 50), [0.0002, 0.0002, 5], [30, 30, 10],
+                                              max_bins=[200, 200, 40])
+    accumulator.add_point((0, 0, 0), 50)
+    accumulator.add(np.array([[0.0], [0.0], [0.0]]), np.array([50.0]))
+    assert accumulator.hist_sum.shape == (30, 30, 10)
+    assert accumulator.outside == 2
+    assert accumulator.hist_count.sum() == 0
+
+    # Points within the cap still grow the grid, and it never exceeds the cap
+    for lon in np.linspace(34.657 - 0.03, 34.657 + 0.03, 301):
+        accumulator.add_point((lon, 31.6457, 50), 10)
+    assert all(bins <= max_bins for bins, max_bins in zip(accumulator.hist_sum.shape, [200, 200, 40]))
+    assert accumulator.hist_count.sum() + accumulator.outside == 303
+    assert accumulator.hist_count.sum() > 0
@@ -1,39 +1,133 @@
 import threading
 import time
-import cv2
-import socket
-import json
-import select
-from queue import Queue, Full, Empty
 from threading import Thread
 
 
+class FrameHandle:
+    """
+    A published frame, read in place from its ring slot.
+
+    Use it as a context manager: while inside, the slot is pinned and the capture thread decodes into other slots.
+    Copy `image` to keep it past the with block.
+    """
+
+    def __init__(self, ring, slot, sequence, image):
+        self.ring = ring
+        self.slot = slot
+        self.sequence = sequence
+        self.image = image
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.ring.release(self)
+
+
+class FrameRing:
+    """
+    Fixed set of reusable frame buffers shared by a capture thread and its consumers.
+
+    The capture thread decodes straight into a free slot (cap.read(image=...)) and publishes it as the latest frame,
+    so no frame is allocated once every slot holds a buffer. Consumers take the latest frame by reference; it is
+    never written to while they hold it. Frames superseded before any consumer took them count as dropped.
+    """
+
+    def __init__(self, slots=4):
+        if slots < 3:
+            raise ValueError("A frame ring needs at least 3 slots: one being decoded, the latest and one being read")
+        self._buffers = [None] * slots  # Allocated by the decoder on first use of each slot
+        self._pins = [0] * slots
+        self._latest_slot = None
+        self._next_slot = 0
+        self.sequence = 0  # Sequence number of the latest published frame, 0 before the first
+        self.decoded = 0
+        self.dropped = 0
+        self.consumed = 0
+        self._last_consumed = 0
+        self.closed = False
+        self._condition = threading.Condition()
+
+    def write_slot(self):
+        """Return (slot, buffer) to decode the next frame into, buffer being None until the slot was used once."""
+        with self._condition:
+            slots = len(self._buffers)
+            for offset in range(slots):
+                slot = (self._next_slot + offset) % slots
+                if slot != self._latest_slot and not self._pins[slot]:
+                    self._next_slot = (slot + 1) % slots
+                    return slot, self._buffers[slot]
+        raise RuntimeError("Every frame slot is held by a consumer")
+
+    def publish(self, slot, image):
+        """Make the frame decoded into a slot the latest one. `image` replaces the slot's buffer if it was reallocated."""
+        with self._condition:
+            self._buffers[slot] = image
+            if self.sequence > self._last_consumed:
+                self.dropped += 1  # The previous latest frame was never taken
+            self.sequence += 1
+            self.decoded += 1
+            self._latest_slot = slot
+            self._condition.notify_all()
+
+    def latest(self, after=0, timeout=None):
+        """
+        Take the latest frame once it is newer than sequence number `after`.
+
+        Returns:
+            frame (FrameHandle or None): The pinned frame, None on timeout or once the ring is closed.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.sequence > after or self.closed, timeout):
+                return None
+            if self.sequence <= after:
+                return None  # Closed
+            slot = self._latest_slot
+            self._pins[slot] += 1
+            if self.sequence > self._last_consumed:
+                self._last_consumed = self.sequence
+                self.consumed += 1
+            return FrameHandle(self, slot, self.sequence, self._buffers[slot])
+
+    def release(self, frame):
+        with self._condition:
+            self._pins[frame.slot] -= 1
+
+    def close(self):
+        """Wake up waiting consumers, no more frames will be published."""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def statistics(self):
+        with self._condition:
+            return {'decoded': self.decoded, 'dropped': self.dropped, 'consumed': self.consumed}
+
+
 class CaptureThread(Thread):
-    def __init__(self, uri: str, queue: Queue, lock: threading.Lock):
+    def __init__(self, uri: str, frames: FrameRing):
         super(CaptureThread, self).__init__()
         self.uri = uri
-        self.queue = queue
-        self.lock = lock
+        self.frames = frames
         self.closed = False
         self.finished = False
 
     def run(self):
+        import cv2  # Only the video path needs OpenCV
+
         print("starting video capture thread...")
-        
+
         cap = cv2.VideoCapture(self.uri)
         try:
             while cap.isOpened() and not self.closed:
-                ret, frame = cap.read()
+                slot, buffer = self.frames.write_slot()
+                # Decode into the slot's buffer, OpenCV only allocates if there is none yet or the frame size changed
+                ret, frame = cap.read() if buffer is None else cap.read(image=buffer)
                 if ret:
-                    try:
-                        # Acquire lock to ensure thread safety when accessing shared resources
-                        with self.lock:
-                            self.queue.put_nowait(frame)
-                    except Full:
-                        self.queue.get_nowait()
-                        self.queue.put_nowait(frame)
+                    self.frames.publish(slot, frame)
         finally:
             self.finished = True
+            self.frames.close()
             cap.release()
 
     def isFinished(self):
@@ -41,57 +135,3 @@ class CaptureThread(Thread):
 
     def close(self):
         self.closed = True
-
-
-class TelemetryThread(Thread):
-    def __init__(self, port: int, bufsize: int, lock: threading.Lock):
-        super(TelemetryThread, self).__init__()
-        self.port = port
-        self.bufsize = bufsize
-        self.lock = lock
-        self.closed = False
-        self.finished = False
-        self.latest_telemetry = None
-
-    def run(self):
-        print("starting API thread...")
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        
-        try:
-            s.connect(('127.0.0.1', self.port))
-            s.setblocking(False)
-            while not self.closed:
-                # TelemetryThread - Network I/O with GIL management
-                with threading.Lock():
-                    ready = select.select([s], [], [], 1)
-                if ready[0]:
-                    try:
-                        data, addr = s.recvfrom(self.bufsize)
-                        try:
-                            # Split the data into multiple JSON objects if necessary
-                            objects = data.decode('UTF-8').splitlines()  # Splitting into lines (or a different separator if needed)
-                            for obj in objects:
-                                temp = json.loads(obj)  # Try to load each object separately
-                                if temp.get("messageType") == "telemetry":
-                                    with self.lock:  # Ensure safe access to telemetry data
-                                        self.latest_telemetry = temp
-                        except json.JSONDecodeError as e:
-                            print(f"JSON Decode Error: {e}")
-                    except ConnectionResetError:
-                        print('record ended')
-                        exit()
-        except ConnectionRefusedError:
-            print('record is off, please start it')
-            exit()
-        finally:
-            self.finished = True
-            s.close()
-
-    def isFinished(self):
-        return self.finished
-
-    def getLatestAsDict(self):
-        return self.latest_telemetry.copy()
-
-    def close(self):
-        self.closed = True
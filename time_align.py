@@ -0,0 +1,80 @@
+import numpy as np
+
+from csv_cache import MISSING_NANO_TIME
+
+DIRECTIONS = ['backward', 'forward', 'nearest']
+
+
+def asof_indices(left_times, right_times, max_gap_ns=None, direction='nearest'):
+    """
+    As-of join of two recordings on videoNanoTime: for each left row, find the matching right row.
+
+    Both columns are matched with one sort of the right times and one searchsorted of the left ones, so neither has
+    to be sorted and no row offsets are needed. Rows with a missing time (MISSING_NANO_TIME) never match.
+
+    Parameters:
+        left_times (np.ndarray): int64 videoNanoTime of the rows to match.
+        right_times (np.ndarray): int64 videoNanoTime of the rows to match them with.
+        max_gap_ns (int or None): Largest accepted time difference, None for no limit.
+        direction (str): 'backward' for the last right row at or before each left row, 'forward' for the first one
+            at or after it, 'nearest' for the closest one (the earlier one on ties).
+
+    Returns:
+        indices (np.ndarray): int64 array of shape (len(left_times),), index into right_times of the match, -1 for
+            left rows without one.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Unknown as-of direction: {direction}, expected one of {DIRECTIONS}")
+    left_times = np.asarray(left_times, dtype=np.int64)
+    right_times = np.asarray(right_times, dtype=np.int64)
+    indices = np.full(len(left_times), -1, dtype=np.int64)
+
+    right_rows = np.flatnonzero(right_times != MISSING_NANO_TIME)
+    right_rows = right_rows[np.argsort(right_times[right_rows], kind='stable')]
+    sorted_times = right_times[right_rows]
+    left_valid = left_times != MISSING_NANO_TIME
+    if len(sorted_times) == 0 or not left_valid.any():
+        return indices
+
+    # Candidate before (last time <= left) and after (first time >= left) each left row, in the sorted order
+    before = np.searchsorted(sorted_times, left_times, side='right') - 1
+    after = np.searchsorted(sorted_times, left_times, side='left')
+    has_before = before >= 0
+    has_after = after < len(sorted_times)
+    gap_before = np.where(has_before, left_times - sorted_times[np.clip(before, 0, None)], np.iinfo(np.int64).max)
+    gap_after = np.where(has_after, sorted_times[np.clip(after, None, len(sorted_times) - 1)] - left_times,
+                         np.iinfo(np.int64).max)
+
+    if direction == 'backward':
+        match, gap = before, gap_before
+    elif direction == 'forward':
+        match, gap = after, gap_after
+    else:
+        use_after = gap_after < gap_before
+        match, gap = np.where(use_after, after, before), np.where(use_after, gap_after, gap_before)
+
+    matched = left_valid & (gap != np.iinfo(np.int64).max)
+    if max_gap_ns is not None:
+        matched &= gap <= max_gap_ns
+    indices[matched] = right_rows[match[matched]]
+    return indices
+
+
+def asof_join(left_times, right_times, right_values, max_gap_ns=None, direction='nearest', fill_value=np.nan):
+    """
+    Align the values of a right recording to the rows of a left one, see asof_indices.
+
+    Parameters:
+        right_values (np.ndarray): Values of the right rows, indexed along the first axis.
+        fill_value: Value of left rows without a match.
+
+    Returns:
+        values (np.ndarray): Array of shape (len(left_times), *right_values.shape[1:]).
+    """
+    right_values = np.asarray(right_values)
+    indices = asof_indices(left_times, right_times, max_gap_ns, direction)
+    values = np.full((len(indices),) + right_values.shape[1:], fill_value,
+                     dtype=np.result_type(right_values, fill_value))
+    matched = indices >= 0
+    values[matched] = right_values[indices[matched]]
+    return values
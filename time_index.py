@@ -0,0 +1,114 @@
+import json
+import os
+
+import numpy as np
+
+from chunked_columns import GrowableArray, column_cells, int_cells
+from csv_cache import MISSING_NANO_TIME, cache_dir_for, file_signature, load_columns
+from csv_index import iter_row_chunks
+
+TIME_INDEX_FILE_NAME = 'time_index.npy'
+TIME_INDEX_META_FILE_NAME = 'time_index.json'
+# File entry keys selecting rows by videoNanoTime, absolute in nanoseconds or in seconds from the first timestamp
+TIME_BOUND_KEYS = ['start_time', 'end_time', 'start_offset_s', 'end_offset_s']
+
+
+def load_time_index(csv_file_path, use_cache=True):
+    """
+    Load the sorted videoNanoTime index of a CSV file, building it if missing or stale.
+
+    The index is the running maximum of the videoNanoTime column, so it is sorted even when a few timestamps are
+    missing or step back, and a binary search in it finds the first row at or after a time. It is persisted in the
+    CSV's sidecar directory and memory-mapped, so a search only reads the few pages it touches.
+
+    Parameters:
+        csv_file_path (str): Path of the telemetry CSV file.
+        use_cache (bool): Build the index from the columnar cache instead of parsing the CSV.
+
+    Returns:
+        nano_times (np.ndarray): int64 array of shape (rows,), non-decreasing, MISSING_NANO_TIME before the first
+            timestamp.
+    """
+    cache_dir = cache_dir_for(csv_file_path)
+    try:
+        with open(os.path.join(cache_dir, TIME_INDEX_META_FILE_NAME), mode='r') as meta_file:
+            if json.load(meta_file) == file_signature(csv_file_path):
+                return np.load(os.path.join(cache_dir, TIME_INDEX_FILE_NAME), mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+    return build_time_index(csv_file_path, use_cache)
+
+
+def build_time_index(csv_file_path, use_cache=True):
+    signature = file_signature(csv_file_path)
+    if use_cache:
+        nano_times = np.asarray(load_columns(csv_file_path)['videoNanoTime'])
+    else:
+        buffer = GrowableArray(np.int64)
+        for chunk in iter_row_chunks(csv_file_path):
+            buffer.extend(int_cells(column_cells(chunk, 'videoNanoTime'), MISSING_NANO_TIME))
+        nano_times = buffer.array
+    nano_times = np.maximum.accumulate(nano_times) if len(nano_times) else nano_times.astype(np.int64)
+
+    cache_dir = cache_dir_for(csv_file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, TIME_INDEX_META_FILE_NAME)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # Invalidate first, the signature is written last once the index is in place
+    # Temporary files per process, so processes building the same index never replace each other's files
+    tmp_path = os.path.join(cache_dir, f'{TIME_INDEX_FILE_NAME}.{os.getpid()}.tmp')
+    with open(tmp_path, mode='wb') as index_file:
+        np.save(index_file, nano_times)
+    os.replace(tmp_path, os.path.join(cache_dir, TIME_INDEX_FILE_NAME))
+    meta_tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(meta_tmp_path, mode='w') as meta_file:
+        json.dump(signature, meta_file)
+    os.replace(meta_tmp_path, meta_path)
+    return nano_times
+
+
+def file_row_range(config, file_config):
+    """
+    Return the (start_row, end_row) a graph file entry selects, resolving its time bounds if it has any.
+
+    A bound can be given as a row (start_row / end_row), as a videoNanoTime in nanoseconds (start_time / end_time)
+    or in seconds from the file's first timestamp (start_offset_s / end_offset_s). Time bounds select the rows with
+    start <= videoNanoTime < end and are resolved with a binary search over load_time_index.
+    """
+    start = _bound(file_config, 'start_row', 'start_time', 'start_offset_s')
+    end = _bound(file_config, 'end_row', 'end_time', 'end_offset_s')
+    if not any(file_config.get(key) is not None for key in TIME_BOUND_KEYS):
+        return start, end
+
+    nano_times = load_time_index(file_config['csv_file_path'], config.get('csv_cache', True))
+    first_time = nano_times[np.searchsorted(nano_times, MISSING_NANO_TIME, side='right'):][:1]
+    return (_time_to_row(nano_times, first_time, file_config, 'start_time', 'start_offset_s', start),
+            _time_to_row(nano_times, first_time, file_config, 'end_time', 'end_offset_s', end))
+
+
+def resolve_time_bounds(config, file_config):
+    """Return the file entry with its time bounds, if any, replaced by the start_row and end_row they select."""
+    if not any(file_config.get(key) is not None for key in TIME_BOUND_KEYS):
+        return file_config
+    start_row, end_row = file_row_range(config, file_config)
+    row_config = {key: value for key, value in file_config.items() if key not in TIME_BOUND_KEYS}
+    return dict(row_config, start_row=start_row, end_row=end_row)
+
+
+def _bound(file_config, row_key, time_key, offset_key):
+    given = [key for key in (row_key, time_key, offset_key) if file_config.get(key) is not None]
+    if len(given) > 1:
+        raise ValueError(f"{file_config['csv_file_path']}: give only one of {', '.join(given)}")
+    return file_config.get(row_key)
+
+
+def _time_to_row(nano_times, first_time, file_config, time_key, offset_key, row):
+    if file_config.get(time_key) is not None:
+        time = int(file_config[time_key])
+    elif file_config.get(offset_key) is not None:
+        if len(first_time) == 0:
+            return 0  # No timestamps at all, nothing is selected
+        time = int(first_time[0]) + round(file_config[offset_key] * 1e9)
+    else:
+        return row
+    return int(np.searchsorted(nano_times, time, side='left'))
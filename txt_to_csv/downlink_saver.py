@@ -1,14 +1,18 @@
-import csv
 import os
 
-from argparse import ArgumentParser
-from queue import Queue
-import threading
-import cv2
-from cv2 import imshow
+from argparse import ArgumentParser, ArgumentTypeError
+
+from thread_helper import CaptureThread, FrameRing
+from telemetry_hub import TelemetryHub
+from telemetry_writer import TELEMETRY_FIELDNAMES, BinaryTelemetryWriter, CsvTelemetryWriter, TelemetryRecorder
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
 
-from thread_helper import CaptureThread as CaptureThread
-from thread_helper import TelemetryThread as TelemetryThread
 
 if __name__ == '__main__':
     # Define the CSV file path
@@ -18,86 +22,76 @@ if __name__ == '__main__':
     parser.add_argument('--telemetry-port', type=int, default=44000, help='The TCP port to listen on for telemetry.')
     parser.add_argument('--telemetry-bufsize', type=int, default=10240,
                         help='The buffer size for a single telemetry message.')
+    parser.add_argument('--binary', action='store_true',
+                        help='Record in the binary record format (convert with telemetry_writer.binary_to_csv).')
+    parser.add_argument('--flush-rows', type=positive_int, default=256, help='Write the recorded rows in batches of this size.')
+    parser.add_argument('--rotate-rows', type=positive_int, default=None,
+                        help='Continue the recording in a new file after this many rows.')
+    parser.add_argument('--no-video', action='store_true',
+                        help='Only record telemetry, never open or decode the video stream.')
     ns = parser.parse_args()
-    lock = threading.Lock()
-
-    closing = False
-    capture_queue = Queue(2)
-
-    capture_thread = CaptureThread('tcp://127.0.0.1:{}?listen'.format(ns.video_port), capture_queue, lock)
-    telemetry_thread = TelemetryThread(ns.telemetry_port, ns.telemetry_bufsize, lock)
-
-    capture_thread.start()
-    telemetry_thread.start()
-    timeout = None
-    last_frame = capture_queue.get(timeout=timeout)
-
-
 
     # Create the 'csvs' subfolder if it doesn't exist
     os.makedirs("../csvs", exist_ok=True)
 
     # Find an available file name in the 'csvs' folder
     base_file_name = "rssi_06_12_2024_15_10"
+    extension = ".bin" if ns.binary else ".csv"
     file_index = 1
-    csv_file_path = os.path.join("../csvs", f"{base_file_name}.csv")
+    csv_file_path = os.path.join("../csvs", f"{base_file_name}{extension}")
 
     while os.path.exists(csv_file_path):
         file_index += 1
-        csv_file_path = os.path.join("../csvs", f"{base_file_name}_v{file_index}.csv")
-
-    # Initialize the CSV file and write the header
-    with open(csv_file_path, mode='w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=["videoNanoTime", "lat", "lon", "aboveSeaLevel", "upLinkPercent",
-                                                  "downLinkPercent", "signalInterference"])
-        writer.writeheader()
-
+        csv_file_path = os.path.join("../csvs", f"{base_file_name}_v{file_index}{extension}")
 
-    last_video_nano_time = None
-    # Main loop to capture and save telemetry data
     save_rssi_flag = True
-    while not closing and not capture_thread.isFinished():
-        current_frame = capture_queue.get(timeout=timeout)
-        telemetry = telemetry_thread.getLatestAsDict()
-
-        # Skip saving if videoNanoTime is the same as the last one
-        if telemetry.get("videoNanoTime") == last_video_nano_time:
-            continue  # Skip this iteration
-        last_video_nano_time = telemetry.get("videoNanoTime")
-
-        # Save telemetry data to CSV
-        with open(csv_file_path, mode='a', newline='') as file:
-            if save_rssi_flag:
-                fieldnames = ["videoNanoTime", "lat", "lon", "aboveSeaLevel", "upLinkPercent", "downLinkPercent", "signalInterference"]
-            else:
-                fieldnames = ["videoNanoTime", "lat", "lon", "aboveSeaLevel", "upLinkPercent", "downLinkPercent"]
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            if save_rssi_flag:
-                writer.writerow({
-                    "videoNanoTime": telemetry.get("videoNanoTime"),
-                    "lat": telemetry.get("lat"),
-                    "lon": telemetry.get("lon"),
-                    "aboveSeaLevel": telemetry.get("aboveSeaLevel"),
-                    "upLinkPercent": telemetry.get("upLinkPercent"),
-                    "downLinkPercent": telemetry.get("downLinkPercent"),
-                    "signalInterference": telemetry.get("signalInterference")
-                })
-            else:
-                writer.writerow({
-                    "videoNanoTime": telemetry.get("videoNanoTime"),
-                    "lat": telemetry.get("lat"),
-                    "lon": telemetry.get("lon"),
-                    "aboveSeaLevel": telemetry.get("aboveSeaLevel"),
-                    "upLinkPercent": telemetry.get("upLinkPercent"),
-                    "downLinkPercent": telemetry.get("downLinkPercent"),
-                })
-
-        # Display the current frame
-        imshow("EyesAtop example", current_frame)
-        if cv2.waitKey(1) == 27:
-            closing = True
-        
-    capture_thread.close()
-    telemetry_thread.close()
-    capture_thread.join()
-    telemetry_thread.join()
\ No newline at end of file
+    fieldnames = TELEMETRY_FIELDNAMES if save_rssi_flag else TELEMETRY_FIELDNAMES[:-1]
+    # One writer for the whole recording, it batches the rows and fsyncs the file when closed
+    if ns.binary:
+        writer = BinaryTelemetryWriter(csv_file_path, flush_rows=ns.flush_rows, rotate_rows=ns.rotate_rows)
+    else:
+        writer = CsvTelemetryWriter(csv_file_path, fieldnames, flush_rows=ns.flush_rows, rotate_rows=ns.rotate_rows)
+
+    telemetry_hub = TelemetryHub(ns.telemetry_port, max_message_bytes=ns.telemetry_bufsize)
+    # The recorder blocks the hub rather than losing samples, other subscribers drop their own messages instead
+    recorder = TelemetryRecorder(telemetry_hub.subscribe('recorder', maxsize=65536, policy='block'), writer)
+    telemetry_hub.start()
+    recorder.start()
+
+    # Telemetry is saved by the recorder thread at its own rate, the video only needs to be shown
+    try:
+        if ns.no_video:
+            print("recording telemetry only, press Ctrl+C to stop")
+            while not telemetry_hub.finished.wait(1):
+                pass
+        else:
+            import cv2  # Only the video path needs OpenCV
+
+            closing = False
+            frame_ring = FrameRing()
+            capture_thread = CaptureThread('tcp://127.0.0.1:{}?listen'.format(ns.video_port), frame_ring)
+            capture_thread.start()
+            frame_sequence = 0  # Sequence number of the last frame shown
+            try:
+                while not closing and not capture_thread.isFinished():
+                    frame = frame_ring.latest(after=frame_sequence)
+                    if frame is None:
+                        break  # Video capture ended
+
+                    # Display the current frame, straight from its ring slot
+                    with frame:
+                        frame_sequence = frame.sequence
+                        cv2.imshow("EyesAtop example", frame.image)
+                    if cv2.waitKey(1) == 27:
+                        closing = True
+            finally:
+                capture_thread.close()
+                capture_thread.join()
+                print(f"video frames: {frame_ring.statistics()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        telemetry_hub.stop()  # Ends the recorder's subscription, it then writes what is left and closes the file
+        recorder.join()
+        telemetry_hub.close()
+        print(f"saved {writer.rows_written} rows to {', '.join(writer.paths)}")